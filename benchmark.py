@@ -0,0 +1,578 @@
+"""Benchmarks for the library engine.
+
+Run with ``python benchmark.py``, or ``python benchmark.py suite --scales small,medium
+--output results.json [--compare baseline.json]`` for the seeded regression suite.
+"""
+import argparse
+import asyncio
+import difflib
+import itertools
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+
+from project import (QUERY_CACHE_SIZE, Book, CatalogReplica, FuzzyMatcher, Library, Member, PickleStorage,
+                     QueryCache, Scheduler, SimulatedClock, SQLiteStorage, TransactionRows, TransactionStore,
+                     write_catalog_file)
+from service import LibraryClient, start_server
+from sharding import ShardedLibrary
+
+
+def build_library(n_books, n_members, n_transactions, seed=0, compact=False, clock=date.today):
+    rng = random.Random(seed)
+    library = Library(compact=compact, clock=clock)
+    for i in range(n_books):
+        library._apply_change("book", {
+            "isbn": f"978{i:010d}", "title": f"Title {i}", "author": f"Author {i % 997}",
+            "genre": f"Genre {i % 23}", "description": None, "total_copies": 3,
+            "available_copies": 3, "reservations": [], "removed": False})
+    for i in range(n_members):
+        library._apply_change("member", {
+            "email": f"member{i}@example.com", "name": f"Member {i}", "age": 20, "password": "Passw0rd!",
+            "borrowed": [], "reserved": [], "notifications": [], "removed": False})
+    start = date(2024, 1, 1)
+    for i in range(n_transactions):
+        borrowed = start + timedelta(days=rng.randrange(365))
+        returned = borrowed + timedelta(days=rng.randrange(40)) if rng.random() < 0.8 else None
+        library._apply_change("transaction", {
+            "id": i, "email": f"member{rng.randrange(n_members)}@example.com",
+            "isbn": f"978{rng.randrange(n_books):010d}", "borrow_date": borrowed.isoformat(),
+            "return_date": returned.isoformat() if returned else None})
+    return library
+
+
+GENRES = ["Fiction", "Mystery", "Romance", "Fantasy", "Science Fiction", "Biography", "History",
+          "Thriller", "Children", "Poetry", "Self-Help", "Science", "Travel", "Cooking", "Philosophy"]
+TITLE_WORDS = ("shadow night river garden empire secret silent winter golden house last city stone heart "
+               "ocean fire glass forest storm lost journey crown island memory broken light dark road queen "
+               "mountain song letters clock machine bridge harbor wolf summer paper iron star dream hidden "
+               "kingdom midnight lantern orchard echo frontier desert compass").split()
+FIRST_NAMES = "Ava Ben Chloe Daniel Emma Farah Gabriel Hana Ivan Julia Kenji Laila Mateo Nora Omar Priya".split()
+LAST_NAMES = "Smith Khan Garcia Chen Okafor Muller Rossi Silva Tanaka Novak Haddad Kowalski Ahmed Park".split()
+
+
+def zipf_weights(n, s=1.0):
+    """Cumulative weights of ranks 1..n under a Zipf(s) law, for random.choices."""
+    return list(itertools.accumulate(1 / rank ** s for rank in range(1, n + 1)))
+
+
+def synthetic_library(n_books, n_members, n_transactions, seed=0, compact=False):
+    """A seeded Library with Zipf-distributed genres, authors, member activity and book popularity.
+
+    ISBNs and emails follow build_library (978{i:010d}, member{i}@example.com).
+    Transactions span 2023-2024; 85% of them are returned.
+    """
+    rng = random.Random(seed)
+    library = Library(compact=compact)
+    genres = rng.choices(GENRES, cum_weights=zipf_weights(len(GENRES)), k=n_books)
+    authors = [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}" for i in range(max(1, n_books // 8))]
+    book_authors = rng.choices(authors, cum_weights=zipf_weights(len(authors)), k=n_books)
+    for i in range(n_books):
+        title = " ".join(rng.sample(TITLE_WORDS, rng.randint(2, 4))).title()
+        copies = rng.choice((1, 1, 2, 3, 5))
+        library._apply_change("book", {
+            "isbn": f"978{i:010d}", "title": title, "author": book_authors[i], "genre": genres[i],
+            "description": None, "total_copies": copies, "available_copies": copies,
+            "reservations": [], "removed": False})
+    for i in range(n_members):
+        library._apply_change("member", {
+            "email": f"member{i}@example.com", "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "age": rng.randint(12, 80), "password": "Passw0rd!",
+            "borrowed": [], "reserved": [], "notifications": [], "removed": False})
+    members = rng.choices(range(n_members), cum_weights=zipf_weights(n_members, 0.8), k=n_transactions)
+    popularity = list(range(n_books))
+    rng.shuffle(popularity)
+    books = rng.choices(popularity, cum_weights=zipf_weights(n_books, 0.9), k=n_transactions)
+    start = date(2023, 1, 1)
+    for i, (m, b) in enumerate(zip(members, books)):
+        borrowed = start + timedelta(days=rng.randrange(730))
+        returned = borrowed + timedelta(days=rng.randint(1, 30)) if rng.random() < 0.85 else None
+        library._apply_change("transaction", {
+            "id": i, "email": f"member{m}@example.com", "isbn": f"978{b:010d}",
+            "borrow_date": borrowed.isoformat(), "return_date": returned.isoformat() if returned else None})
+    return library
+
+
+SCALES = {
+    "small": (1_000, 500, 5_000),
+    "medium": (10_000, 5_000, 50_000),
+    "large": (50_000, 20_000, 200_000),
+}
+
+
+def _timed(func, repeat):
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - start)
+    return {"median_us": statistics.median(samples) * 1e6, "min_us": min(samples) * 1e6, "runs": repeat}
+
+
+def suite_scale(n_books, n_members, n_transactions, seed=0, repeat=50):
+    """Time the core Library operations on one synthetic library; returns {operation: timings}."""
+    rng = random.Random(seed + 1)
+    build_start = time.perf_counter()
+    library = synthetic_library(n_books, n_members, n_transactions, seed)
+    results = {"build": {"median_us": (time.perf_counter() - build_start) * 1e6, "runs": 1}}
+    books, members = library.books, library.members
+    hits = [rng.choice(books).title.split()[-1] for _ in range(repeat)]
+    misses = ["qzx" + str(i) for i in range(repeat)]
+    fuzzy = [t[:-2] + t[-1] + t[-2] for t in (rng.choice(books).title for _ in range(repeat))]
+    names = [rng.choice(members).name for _ in range(repeat)]
+    # fresh members, so earlier overdue loans do not block borrowing
+    borrowers = []
+    for i in range(repeat):
+        email = f"bench{i}@example.com"
+        library._apply_change("member", {"email": email, "name": f"Bench {i}", "age": 30, "password": "Passw0rd!",
+                                         "borrowed": [], "reserved": [], "notifications": [], "removed": False})
+        borrowers.append(library.get_member_by_email(email))
+    loans = [(borrowers[i], rng.choice(books).isbn) for i in range(repeat)]
+    readers = [rng.choice(members) for _ in range(repeat)]
+    # time the queries themselves; the cache is measured separately below
+    library.query_cache.maxsize = 0
+
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        results["search_book_hit"] = _timed(lambda i: library.search_book(hits[i]), repeat)
+        results["search_book_miss"] = _timed(lambda i: library.search_book(misses[i]), repeat)
+        results["search_book_fuzzy"] = _timed(lambda i: library.search_book(fuzzy[i]), repeat)
+        results["search_member"] = _timed(lambda i: library.search_member(names[i]), repeat)
+        library.query_cache.maxsize = QUERY_CACHE_SIZE
+        library.search_book(fuzzy[0])
+        results["search_book_cached"] = _timed(lambda i: library.search_book(fuzzy[0]), repeat)
+        library.query_cache.maxsize = 0
+        results["borrow_book"] = _timed(lambda i: library.borrow_book(*loans[i], reserve=False), repeat)
+        results["return_book"] = _timed(lambda i: library.return_book(*loans[i]), repeat)
+        results["recommend_personalized"] = _timed(
+            lambda i: library.recommend_books(readers[i], mode="personalized"), repeat)
+        results["recommend_generic"] = _timed(
+            lambda i: library.recommend_books(None, mode="generic", query_title=fuzzy[i]), repeat)
+        results["compute_fines_all"] = _timed(lambda i: library.compute_fines(date(2025, 1, 1)), 5)
+        results["compute_fines_member"] = _timed(
+            lambda i: library.compute_fines(date(2025, 1, 1), [readers[i]]), repeat)
+        results["outstanding_fine"] = _timed(lambda i: library.outstanding_fine(readers[i]), repeat)
+        results["overdue_loans"] = _timed(lambda i: library.overdue_loans(date(2025, 1, 1)), 5)
+        with tempfile.TemporaryDirectory() as tmp:
+            library.storage = PickleStorage(os.path.join(tmp, "library.pkl"))
+            results["save_library"] = _timed(lambda i: library.save_library(), 3)
+            results["retrieve_library"] = _timed(
+                lambda i: Library(PickleStorage(library.storage.path)).retrieve_library(), 3)
+    return results
+
+
+def run_suite(scales=("small", "medium"), seed=0, repeat=50, output="benchmark_results.json"):
+    """Run suite_scale at each named scale and write the results as JSON."""
+    report = {"meta": {"seed": seed, "repeat": repeat, "python": platform.python_version(),
+                       "platform": platform.platform(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+              "scales": {}}
+    for scale in scales:
+        n_books, n_members, n_transactions = SCALES[scale]
+        results = suite_scale(n_books, n_members, n_transactions, seed, repeat)
+        report["scales"][scale] = {"books": n_books, "members": n_members, "transactions": n_transactions,
+                                   "results": results}
+        for name, timing in results.items():
+            print(f"{scale:>6} {name:<24} {timing['median_us'] / 1e3:10.3f} ms")
+    if output:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {output}")
+    return report
+
+
+def compare_reports(baseline, current, tolerance=0.25, noise_us=100):
+    """Print operations whose median got more than `tolerance` (and noise_us) slower; returns how many did."""
+    regressions = 0
+    for scale, entry in current["scales"].items():
+        before = baseline.get("scales", {}).get(scale, {}).get("results", {})
+        for name, timing in entry["results"].items():
+            if name in before and before[name]["median_us"] > 0:
+                ratio = timing["median_us"] / before[name]["median_us"]
+                if ratio > 1 + tolerance and timing["median_us"] - before[name]["median_us"] > noise_us:
+                    regressions += 1
+                    print(f"REGRESSION {scale} {name}: {ratio:.2f}x slower")
+    return regressions
+
+
+def bench_fines(n_transactions=200_000):
+    library = build_library(1_000, 1_000, n_transactions)
+    as_of = date(2025, 1, 1)
+
+    started = time.perf_counter()
+    expected = [t.calculate_fine(as_of) for t in library.transactions]
+    per_object = time.perf_counter() - started
+
+    started = time.perf_counter()
+    ids, fines = library.compute_fines(as_of)
+    batch = time.perf_counter() - started
+
+    assert list(ids) == [t.id for t in library.transactions]
+    assert list(fines) == expected, "compute_fines disagrees with Transaction.calculate_fine"
+    members = library.members[:10]
+    ids, fines = library.compute_fines(as_of, members)
+    assert list(fines) == [t.calculate_fine(as_of) for m in members for t in m.transactions]
+    print(f"fines over {n_transactions} transactions: calculate_fine {per_object:.3f}s, "
+          f"compute_fines {batch:.3f}s")
+
+
+def history_bytes(library):
+    """Bytes held by the transaction history itself: the store, its id index and the members' histories."""
+    seen = set()
+
+    def size(obj):
+        if obj is None or id(obj) in seen:
+            return 0
+        seen.add(id(obj))
+        return sys.getsizeof(obj)
+    total = size(library.transactions) + size(library._transactions_by_id)
+    if isinstance(library.transactions, TransactionStore):
+        total += sum(size(column) for column in vars(library.transactions).values())
+    else:
+        for t in library.transactions:
+            total += size(t) + size(t.borrow_date) + size(t.due_date) + size(t.return_date)
+    for member in library.members:
+        total += size(member.transactions)
+        if isinstance(member.transactions, TransactionRows):
+            total += size(member.transactions.rows)
+    return total
+
+
+def bench_memory(n_transactions=200_000):
+    for compact in (False, True):
+        tracemalloc.start()
+        library = build_library(2_000, 2_000, n_transactions, compact=compact)
+        traced, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        pickled = len(pickle.dumps(library))
+        # traced also counts indexes and the recommender, which are the same in both modes
+        print(f"{'compact' if compact else 'default'} mode, {n_transactions} transactions: "
+              f"{history_bytes(library) / 2**20:.1f} MiB history, {traced / 2**20:.1f} MiB traced in total, "
+              f"{pickled / 2**20:.1f} MiB pickled")
+
+
+def stress_circulation(n_threads=16, n_ops=2_000, n_books=5, copies=3, seed=0):
+    """Hammer one Library from many threads and check the copy invariants."""
+    library = Library()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        books = [Book(f"Title {i}", "Author", f"isbn-{i}", "Genre", total_copies=copies) for i in range(n_books)]
+        members = [Member(f"Member {i}", 20, f"member{i}@example.com", "Passw0rd!") for i in range(n_threads)]
+        for book in books:
+            library._add_book(book)
+        for member in members:
+            library._add_member(member)
+
+        violations = []
+
+        def check():
+            for book in books:
+                if not 0 <= book.available_copies <= book.total_copies:
+                    violations.append(f"{book.isbn}: {book.available_copies}/{book.total_copies}")
+
+        def worker(member, rng):
+            for _ in range(n_ops):
+                book = rng.choice(books)
+                roll = rng.random()
+                if roll < 0.45:
+                    library.borrow_book(member, book.isbn, reserve=True)
+                elif roll < 0.9:
+                    library.return_book(member, book.isbn)
+                else:
+                    library.reserve_book(member, book)
+                check()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        threads = [threading.Thread(target=worker, args=(m, random.Random(seed + i))) for i, m in enumerate(members)]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+        elapsed = time.perf_counter() - started
+
+    on_loan = Counter(t.book for t in library.transactions if t.return_date is None)
+    for book in books:
+        if book.available_copies + on_loan[book] != book.total_copies:
+            violations.append(f"{book.isbn}: {book.available_copies} available, {on_loan[book]} on loan, "
+                              f"{book.total_copies} total")
+    for member in members:
+        if Counter(member.borrowed_books) != Counter(t.book for t in library.open_loans(member)):
+            violations.append(f"{member.email}: borrowed books disagree with open loans")
+    assert not violations, violations[:10]
+    print(f"stress: {n_threads} threads x {n_ops} ops in {elapsed:.2f}s, "
+          f"{len(library.transactions)} loans, invariants held")
+
+
+async def _load(n_clients, n_requests, n_books, n_members):
+    library = build_library(n_books, n_members, 0)
+    server = await start_server(library, port=0)
+    port = server.sockets[0].getsockname()[1]
+    latencies = []
+
+    async def client(i):
+        rng = random.Random(i)
+        connection = await LibraryClient.connect(port=port)
+        email = f"member{i % n_members}@example.com"
+        for _ in range(n_requests):
+            isbn = f"978{rng.randrange(n_books):010d}"
+            op, params = rng.choice([
+                ("search", {"query": f"title {rng.randrange(n_books)}", "limit": 5}),
+                ("borrow", {"email": email, "book": isbn}),
+                ("return", {"email": email, "book": isbn}),
+                ("dues", {"email": email}),
+                ("notifications", {"email": email}),
+            ])
+            started = time.perf_counter()
+            response = await connection.call(op, **params)
+            latencies.append(time.perf_counter() - started)
+            assert response["ok"], response
+        await connection.close()
+
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(client(i) for i in range(n_clients)))
+    return latencies, time.perf_counter() - started
+
+
+def bench_recommend(n_transactions=20_000, n_calls=2_000):
+    library = build_library(5_000, 2_000, n_transactions)
+    members = library.members[:n_calls]
+    start = time.perf_counter()
+    for member in members:
+        library.recommend_books(member, mode="personalized", n=5)
+    personalized = (time.perf_counter() - start) / len(members)
+    start = time.perf_counter()
+    for i in range(200):
+        library.recommend_books(None, mode="generic", query_title=f"Titel {i * 7}", n=5)
+    generic = (time.perf_counter() - start) / 200
+    print(f"recommend: personalized {personalized * 1e6:.0f} us/call, generic {generic * 1e3:.2f} ms/call")
+
+
+def bench_cold_start(n_transactions=200_000, path="bench_cold_start.db"):
+    """retrieve_library from SQLite with the whole history vs open loans only."""
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    storage = SQLiteStorage(path)
+    storage.write_all(build_library(5_000, 5_000, n_transactions))
+    storage.close()
+    try:
+        for lazy in (False, True):
+            library = Library(SQLiteStorage(path, lazy_history=lazy))
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                library.retrieve_library()
+            elapsed = time.perf_counter() - start
+            print(f"cold start ({'open loans only' if lazy else 'full history'}): {elapsed:.2f} s, "
+                  f"{len(library.transactions)} transactions in memory")
+            member = library.members[0]
+            start = time.perf_counter()
+            library.compute_fines(date(2025, 1, 1), [member])
+            print(f"  first dues lookup for one member: {(time.perf_counter() - start) * 1e3:.1f} ms")
+            library.storage.close()
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def bench_replica(n_books=100_000, path="bench_catalog.bin"):
+    """Per-process cost of a kiosk: unpickling the catalog vs mapping the catalog file."""
+    library = build_library(n_books, 1, 0)
+    write_catalog_file(library.books, path)
+    data = pickle.dumps(library.books)
+    try:
+        tracemalloc.start()
+        books = pickle.loads(data)
+        loaded = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del books
+        tracemalloc.start()
+        replica = CatalogReplica(path)
+        start = time.perf_counter()
+        for i in range(100):
+            replica.search_book(f"978{i * 997:010d}")
+        elapsed = (time.perf_counter() - start) / 100
+        mapped = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        replica.close()
+        print(f"replica: {n_books} books, unpickled {loaded / 2**20:.1f} MiB vs mapped {mapped / 2**20:.2f} MiB "
+              f"of Python heap, {elapsed * 1e3:.2f} ms/search")
+    finally:
+        os.remove(path)
+
+
+def bench_login(sizes=(1_000, 10_000, 100_000), n_logins=20):
+    """Login cost should not grow with the member count; it is dominated by the password hash."""
+    for n_members in sizes:
+        library = build_library(1, n_members, 0)
+        rng = random.Random(n_members)
+        emails = [f"member{rng.randrange(n_members)}@example.com" for _ in range(n_logins)]
+        for email in set(emails):
+            library.authenticate(email, "Passw0rd!")  # upgrade the plaintext seed password to a hash
+        start = time.perf_counter()
+        tokens = [library.login(email, "Passw0rd!") for email in emails]
+        login = (time.perf_counter() - start) / n_logins
+        start = time.perf_counter()
+        for _ in range(100):
+            for token in tokens:
+                library.session_member(token)
+        session = (time.perf_counter() - start) / (100 * n_logins)
+        print(f"login: {n_members} members, {login * 1e3:.1f} ms/login, {session * 1e6:.2f} us/session lookup")
+
+
+def bench_query_cache(n_queries=5_000, borrow_every=50):
+    """Zipf-distributed desk searches with a borrow now and then, with and without the query cache."""
+    library = synthetic_library(10_000, 5_000, 50_000)
+    rng = random.Random(1)
+    pool = [book.title.split()[-1] for book in rng.sample(library.books, 500)]
+    queries = rng.choices(pool, cum_weights=zipf_weights(len(pool)), k=n_queries)
+    reader = library.members[0]
+    for size in (0, QUERY_CACHE_SIZE):
+        library.query_cache = QueryCache(maxsize=size)
+        with redirect_stdout(None):
+            start = time.perf_counter()
+            for i, query in enumerate(queries):
+                library.search_book(query)
+                if i % borrow_every == 0:
+                    library.recommend_books(reader, mode="personalized")
+                    library.borrow_book(reader, rng.choice(library.books).isbn, reserve=False)
+            elapsed = time.perf_counter() - start
+        hit_rate = library.query_cache.stats()["queries"].get("search_book", {}).get("hit_rate", 0.0)
+        print(f"query cache: size {size}, {elapsed / n_queries * 1e6:.0f} us/query, search hit rate {hit_rate:.0%}")
+
+
+def bench_scheduler(n_timers=1_000_000, n_transactions=200_000, days=30):
+    """Raw timer throughput, then a simulated month of overdue reminders on a large history."""
+    rng = random.Random(0)
+    scheduler = Scheduler()
+    start = date(2025, 1, 1)
+    begin = time.perf_counter()
+    for i in range(n_timers):
+        scheduler.schedule("overdue", i, start + timedelta(days=rng.randrange(365)))
+    for i in range(0, n_timers, 2):
+        scheduler.cancel("overdue", i)
+    fired = sum(1 for _ in scheduler.pop_due(start + timedelta(days=365)))
+    per_timer = (time.perf_counter() - begin) / n_timers
+    print(f"scheduler: {n_timers} timers, {fired} fired, {per_timer * 1e6:.2f} us/timer")
+
+    clock = SimulatedClock(date(2025, 1, 1))
+    library = build_library(10_000, 5_000, n_transactions, clock=clock)
+    events, elapsed = 0, 0.0
+    with redirect_stdout(None):
+        for _ in range(days):
+            clock.advance()
+            begin = time.perf_counter()
+            events += library.run_scheduler()
+            elapsed += time.perf_counter() - begin
+    print(f"scheduler: {len(library.scheduler)} live timers, {events} reminders over {days} days, "
+          f"{elapsed / max(events, 1) * 1e6:.1f} us/reminder")
+
+
+def bench_fuzzy(n_books=50_000, n_queries=20, worker_counts=(1, 2, 4)):
+    """Typo'd title lookups: difflib.get_close_matches vs the fuzzy matcher on 1..N worker processes."""
+    library = synthetic_library(n_books, 10, 0)
+    library.query_cache.maxsize = 0
+    titles = [book.title for book in library.books]
+    rng = random.Random(2)
+    queries = []
+    for title in rng.sample(titles, n_queries):
+        i = rng.randrange(len(title))
+        queries.append(title[:i] + rng.choice("aeiorst") + title[i + 1:])
+    start = time.perf_counter()
+    expected = [difflib.get_close_matches(q, titles, 3, 0.3) for q in queries]
+    baseline = (time.perf_counter() - start) / n_queries
+    print(f"fuzzy: {n_books} titles, difflib {baseline * 1e3:.1f} ms/query")
+    for workers in worker_counts:
+        library.fuzzy = FuzzyMatcher(workers)
+        library._close_titles(queries[0], 3, 0.3)  # start the pool outside the timing
+        start = time.perf_counter()
+        got = [library._close_titles(q, 3, 0.3) for q in queries]
+        elapsed = (time.perf_counter() - start) / n_queries
+        library.fuzzy.close()
+        print(f"fuzzy: {workers} worker(s), {elapsed * 1e3:.1f} ms/query, {baseline / elapsed:.1f}x, "
+              f"{'same' if got == expected else 'DIFFERENT'} ranking")
+
+
+def bench_sharded(n_books=20_000, n_queries=80, shard_counts=(1, 2, 4), n_threads=8):
+    """Fuzzy-search throughput from many threads: one in-process Library vs N shard processes."""
+    rng = random.Random(0)
+    records = [{"isbn": f"978{i:010d}", "title": f"{rng.choice(TITLE_WORDS).title()} {rng.choice(TITLE_WORDS)} {i}",
+                "author": f"Author {i % 997}", "genre": rng.choice(GENRES)} for i in range(n_books)]
+    queries = [f"{rng.choice(TITLE_WORDS)}x{i}" for i in range(n_queries)]  # distinct misses: the fuzzy path
+
+    def run(search):
+        threads = [threading.Thread(target=lambda k=k: [search(q) for q in queries[k::n_threads]])
+                   for k in range(n_threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return n_queries / (time.perf_counter() - start)
+
+    library = Library()
+    library._add_books([Book(r["title"], r["author"], r["isbn"], r["genre"]) for r in records])
+    library.query_cache.maxsize = 0
+    print(f"sharded: in-process library, {run(library.search_book):.0f} searches/s")
+    for n_shards in shard_counts:
+        with ShardedLibrary(n_shards) as sharded, redirect_stdout(None):
+            sharded.add_books(records)
+            rate = run(sharded.search_book)
+        print(f"sharded: {n_shards} shards, {rate:.0f} searches/s")
+
+
+def bench_service(n_clients=500, n_requests=40, n_books=5_000, n_members=1_000):
+    """Load generator for service.py: many concurrent clients against one Library."""
+    latencies, elapsed = asyncio.run(_load(n_clients, n_requests, n_books, n_members))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000
+    print(f"service: {n_clients} clients, {len(latencies)} requests, {len(latencies) / elapsed:.0f} req/s, "
+          f"p50 {p50:.2f} ms, p99 {p99:.2f} ms")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Library benchmarks.")
+    parser.add_argument("command", nargs="?", default="all", choices=["all", "suite"])
+    parser.add_argument("--scales", default="small,medium", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="baseline JSON; exit non-zero when an operation regressed")
+    args = parser.parse_args(argv)
+    if args.command == "suite":
+        report = run_suite(args.scales.split(","), args.seed, args.repeat, args.output)
+        if args.compare:
+            with open(args.compare) as file:
+                sys.exit(1 if compare_reports(json.load(file), report) else 0)
+        return
+    bench_fines()
+    bench_memory()
+    stress_circulation()
+    bench_recommend()
+    bench_cold_start()
+    bench_replica()
+    bench_login()
+    bench_query_cache()
+    bench_scheduler()
+    bench_fuzzy()
+    bench_sharded()
+    bench_service()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
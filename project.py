@@ -1,29 +1,182 @@
+from array import array
 from datetime import date, timedelta
 from tabulate import tabulate
 import pickle
 import validators
+import bisect
+import contextvars
+import cProfile
+import csv
 import difflib
-from collections import Counter
+import functools
+import hashlib
+import heapq
+import hmac
+import itertools
+import io
+import json
+import mmap
+import os
+import pstats
+import secrets
+import smtplib
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from collections import Counter, OrderedDict, deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:  # compute_fines falls back to Transaction.calculate_fine
+    np = None
 
 
 BORROW_LIMIT = 3
-
-def validate_credentials(email, password):
-    email_address = validators.email(email)
-    if not email_address:
-        print("Invalid email format.")
-        return False
+FINE_PER_DAY = 0.5
+
+NGRAM_SIZE = 3
+IMPORT_BATCH = 1000
+PAGE_SIZE = 20
+PASSWORD_ITERATIONS = 200_000
+SESSION_TTL = 30 * 60  # seconds
+SESSION_SWEEP = 60  # seconds between purges of expired sessions
+HOLD_DAYS = 3  # a returned copy is held this long for the next reserver
+REMINDER_DAYS = 7  # overdue reminders repeat this often
+QUERY_CACHE_SIZE = 1024  # cached search/recommend results; 0 turns the cache off
+QUERY_CACHE_TTL = 5 * 60  # seconds
+CO_BORROW_WINDOW = 10  # a new borrow is paired with the member's last N distinct books
+TITLE_SHORTLIST = 200  # trigram-similar titles scored first to raise the fuzzy-match threshold
+PARALLEL_FUZZY_MIN = 20_000  # fewer titles than this are matched in-process
+
+def normalize_key(value):
+    return str(value).strip().lower()
+
+def restore_state(obj, state, **defaults):
+    """__setstate__ helper for objects pickled with or without __slots__."""
+    if isinstance(state, tuple):  # (dict state, slot state)
+        state = {**(state[0] or {}), **state[1]}
+    for name, value in {**defaults, **state}.items():
+        setattr(obj, name, value)
+
+def book_tokens(book):
+    return {token for field in (book.title, book.author, book.isbn, book.genre)
+            for token in field.lower().split()}
+
+def title_trigrams(title):
+    title = title.lower()
+    return {title[i:i + 3] for i in range(len(title) - 2)} or {title}
+
+def ngrams(token):
+    return {token[i:i + size] for size in range(1, NGRAM_SIZE + 1)
+            for i in range(len(token) - size + 1)}
+
+def credential_problem(email, password):
+    """The reason email/password are unacceptable, or None."""
+    if not validators.email(email):
+        return "Invalid email format."
     if len(password) < 8:
-        print("Password must be at least 8 characters long.")
-        return False
+        return "Password must be at least 8 characters long."
     if not any(char.isdigit() for char in password):
-        print("Password must contain at least one digit.")
-        return False
+        return "Password must contain at least one digit."
     if not any(char.isupper() for char in password):
-        print("Password must contain at least one uppercase letter.")
+        return "Password must contain at least one uppercase letter."
+    return None
+
+def validate_credentials(email, password):
+    problem = credential_problem(email, password)
+    if problem:
+        print(problem)
         return False
     return True
 
+def hash_password(password, salt=None, iterations=PASSWORD_ITERATIONS):
+    """Salted PBKDF2-SHA256, stored as pbkdf2_sha256$iterations$salt$hash."""
+    salt = salt or secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt.encode(), iterations).hex()
+    return f"pbkdf2_sha256${iterations}${salt}${digest}"
+
+def is_password_hash(stored):
+    return isinstance(stored, str) and stored.startswith("pbkdf2_sha256$")
+
+def check_password(stored, password):
+    """Compare password against a stored hash, or a plaintext password from older libraries."""
+    if not is_password_hash(stored):
+        return hmac.compare_digest(str(stored).encode(), password.encode())
+    _, iterations, salt, digest = stored.split("$")
+    return hmac.compare_digest(hash_password(password, salt, int(iterations)).rsplit("$", 1)[1], digest)
+
+# checked against unknown emails so they take as long as a wrong password
+DUMMY_PASSWORD_HASH = "pbkdf2_sha256$200000$7d43c89cf18bfbe2630af9d4cd42de14$6ac08eea55848fd4ec94299398e577803591c0cc9bf36d37e66b697178b9f6ce"
+
+def copy_count(value):
+    """A copy count from an import row as a positive int (blank means 1), or None when it isn't one."""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 1
+    if isinstance(value, str):
+        try:
+            value = int(value.strip())
+        except ValueError:
+            return None
+    elif isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, bool) or not isinstance(value, int):
+        return None
+    return value if value >= 1 else None
+
+def member_record_problem(record):
+    """Validation for one register_members_bulk record; runs in a worker pool."""
+    if not isinstance(record, dict):
+        return "not a record"
+    if not str(record.get("name") or "").strip():
+        return "missing name"
+    try:
+        int(record.get("age"))
+    except (TypeError, ValueError):
+        return f"bad age {record.get('age')!r}"
+    return credential_problem(str(record.get("email") or "").strip(), str(record.get("password") or ""))
+
+def check_member_record(record):
+    """(problem, password hash) for one bulk record; the hash is only computed for valid rows."""
+    problem = member_record_problem(record)
+    return problem, None if problem else hash_password(str(record["password"]))
+
+def paginate(items, offset=0, limit=PAGE_SIZE, key=None, reverse=False):
+    """Lazily yield items [offset, offset + limit) in key order; limit=None runs to the end.
+
+    A sorted page keeps only offset + limit items in a heap rather than sorting everything.
+    """
+    if key is not None:
+        if limit is None:
+            items = sorted(items, key=key, reverse=reverse)
+        else:
+            items = (heapq.nlargest if reverse else heapq.nsmallest)(offset + limit, items, key=key)
+    return islice(items, offset, None if limit is None else offset + limit)
+
+def show_rows(headers, rows, stream=False):
+    """Print rows with tabulate, or line by line (no width pass over the rows) when stream is set."""
+    if stream:
+        print(" | ".join(headers))
+        for row in rows:
+            print(" | ".join("" if value is None else str(value) for value in row))
+    else:
+        print(tabulate(list(rows), headers=headers))
+
+def browse(show):
+    """Page through show(offset) -> next offset until the end or the user stops."""
+    offset = 0
+    while offset is not None:
+        offset = show(offset)
+        if offset is not None and input("Enter for the next page, q to stop: ").strip().lower() == "q":
+            break
+
 login = {
     "email": "admin@gmail.com",
     "password": "Admin@123"
@@ -31,7 +184,7 @@ login = {
 
 def forgot_password(library):
     email = input("Enter your email: ")
-    if user := library.search_member(email):
+    if user := library.get_member_by_email(email):
         new_password = input("Enter new password: ")
         if not validate_credentials(email, new_password):
             return 
@@ -42,10 +195,11 @@ def forgot_password(library):
 def signin(library):
     email = input("Enter your email: ")
     password = input("Enter your password: ")
-    if email == login["email"] and password == login["password"]:
+    if hmac.compare_digest(email.encode(), login["email"].encode()) and \
+            hmac.compare_digest(password.encode(), login["password"].encode()):
         print("Login successful!")
         return library.librarian
-    member = library.search_member(email, password)
+    member = library.authenticate(email, password)
     if member:
         print("Login successful!")
         return member
@@ -53,21 +207,87 @@ def signin(library):
     return None
 
 class User:
-    def __init__(self, name, age, email, password):
+    __slots__ = ("name", "age", "email", "password")
+
+    def __init__(self, name, age, email, password, hashed=False):
         self.name = name
         self.age = age
         self.email = email
-        self.password = password
+        # only the salted hash is kept; hashed=True means password already is one
+        self.password = password if hashed else hash_password(password)
+
+    def __setstate__(self, state):
+        restore_state(self, state)
 
     def __str__(self):
         return f"User(name={self.name}, age={self.age}, email={self.email})"
     def change_password(self, new_password, library):
         if not validate_credentials(self.email, new_password):
             return
-        self.password = new_password
+        self.password = hash_password(new_password)
+        library._record(("member", self))
+        library.end_sessions(self)
         print("Password changed successfully.")
 
+class ReservationQueue:
+    """Holds on one title, FIFO within each priority tier (lower tiers are served first).
+
+    Membership, enqueue and cancel are dictionary operations; cancelled
+    entries stay in their deque and are skipped when they reach the front.
+    """
+
+    __slots__ = ("_tiers", "_live", "_seq")
+
+    def __init__(self, members=()):
+        self._tiers = {}
+        self._live = {}
+        self._seq = 0
+        for member in members:
+            self.append(member)
+
+    def append(self, member, tier=0):
+        if member in self._live:
+            return False
+        self._seq += 1
+        self._live[member] = (tier, self._seq)
+        self._tiers.setdefault(tier, deque()).append((self._seq, member))
+        return True
+
+    def cancel(self, member):
+        return self._live.pop(member, None) is not None
+
+    def popleft(self):
+        for tier in sorted(self._tiers):
+            queue = self._tiers[tier]
+            while queue:
+                seq, member = queue.popleft()
+                if self._live.get(member) == (tier, seq):
+                    del self._live[member]
+                    return member
+            del self._tiers[tier]
+        raise IndexError("pop from an empty reservation queue")
+
+    def entries(self):
+        """(member, tier) pairs in the order they will be served."""
+        for tier in sorted(self._tiers):
+            for seq, member in self._tiers[tier]:
+                if self._live.get(member) == (tier, seq):
+                    yield member, tier
+
+    def __iter__(self):
+        return (member for member, tier in self.entries())
+
+    def __contains__(self, member):
+        return member in self._live
+
+    def __len__(self):
+        return len(self._live)
+
+
 class Book:
+    __slots__ = ("title", "author", "isbn", "genre", "description", "total_copies",
+                 "available_copies", "reservation_queue", "borrowed", "holds")
+
     def __init__(self, title, author, isbn, genre, description=None, borrowed=False, total_copies=1):
         self.title = title
         self.author = author
@@ -76,18 +296,28 @@ class Book:
         self.description = description
         self.total_copies = total_copies
         self.available_copies = total_copies
-        self.reservation_queue = []
+        self.reservation_queue = ReservationQueue()
+        self.holds = {}  # member -> last day a returned copy is kept for them
         
+    def __setstate__(self, state):
+        # pickles written before genre and copy counts existed
+        borrowed = (state[1] if isinstance(state, tuple) else state).get("borrowed")
+        restore_state(self, state, genre="", description=None, total_copies=1,
+                      available_copies=0 if borrowed else 1, reservation_queue=ReservationQueue(), holds={})
+        if isinstance(self.reservation_queue, list):
+            self.reservation_queue = ReservationQueue(self.reservation_queue)
 
     def __str__(self):
         return f"Book(title={self.title}, author={self.author}, isbn={self.isbn}, genre={self.genre}, description={self.description})"
     
-    def is_available(self):
-        return self.available_copies > 0
+    def is_available(self, member=None):
+        # copies on hold only count for the member they are held for
+        return self.available_copies - len(self.holds) + (member in self.holds) > 0
 
-    def borrow_copy(self):
-        if self.is_available():
+    def borrow_copy(self, member=None):
+        if self.is_available(member):
             self.available_copies -= 1
+            self.holds.pop(member, None)
             return True
         return False
 
@@ -96,33 +326,55 @@ class Book:
             self.available_copies += 1
         
     
-    def reserve_book(self, member):
+    def reserve_book(self, member, tier=0):
         if member in self.reservation_queue:
             print(f"You’ve already reserved '{self.title}'.")
             return False
-        if self.available_copies > 0:
+        if self.is_available(member):
             print(f"{self.title} is available. You can borrow it directly.")
             return False
-        self.reservation_queue.append(member)
+        self.reservation_queue.append(member, tier)
         member.notify(f"You reserved '{self.title}'. You’ll be notified when it’s available.")
         print(f"{member.name} has reserved '{self.title}'.")
         return True
         
-    def notify_next_reserver(self):
+    def notify_next_reserver(self, hold_until=None):
+        """(member, message) for the reserver now served, or None."""
         if self.reservation_queue:
-            next_member = self.reservation_queue.pop(0)
-            next_member.notify(f"'{self.title}' is now available for you to borrow.")
+            next_member = self.reservation_queue.popleft()
+            if self in next_member.reserved_books:
+                next_member.reserved_books.remove(self)
+            if hold_until is None:
+                message = f"'{self.title}' is now available for you to borrow."
+            else:
+                self.holds[next_member] = hold_until
+                message = (f"'{self.title}' is now available for you to borrow. "
+                           f"It is held for you until {hold_until}.")
+            next_member.notify(message)
             print(f"Notification sent to {next_member.name} for '{self.title}'.")
+            return next_member, message
+        return None
+
+    def cancel_reservation(self, member):
+        if not self.reservation_queue.cancel(member):
+            return False
+        if self in member.reserved_books:
+            member.reserved_books.remove(self)
+        return True
 
 
 class Member(User):
-    def __init__(self, name, age, email, password):
+    __slots__ = ("borrowed_books", "transactions", "notifications", "reserved_books")
+
+    def __init__(self, name, age, email, password, hashed=False):
         self.borrowed_books = []
         self.transactions = []
         self.notifications = []
         self.reserved_books = []
-        super().__init__(name, age, email, password)
+        super().__init__(name, age, email, password, hashed)
 
+    def __setstate__(self, state):
+        restore_state(self, state, notifications=[], reserved_books=[])
  
     def search_book(self, title, library):
         if book := library.search_book(title):
@@ -139,6 +391,9 @@ class Member(User):
             self.borrowed_books.remove(book)
 
     def add_transaction(self, transaction):
+        if isinstance(transaction, CompactTransaction) and not isinstance(self.transactions, TransactionRows):
+            # compact mode: keep row ids rather than one view object per loan
+            self.transactions = TransactionRows(transaction._store, (t.id for t in self.transactions))
         self.transactions.append(transaction)
 
     def view_borrowed_books(self):
@@ -149,79 +404,1445 @@ class Member(User):
             for book in self.borrowed_books:
                 print(f" - {book.title} by {book.author}")
 
-    def view_pending_dues(self):
-        if not self.transactions:
-            print("You have no pending dues.")
-            return
-        print("Pending dues:")
-        for transaction in self.transactions:
-      
-            fine = transaction.calculate_fine(date.today())
-            print(f"Book: {transaction.book.title}, Due Date: {transaction.due_date}, Fine: ${fine:.2f}")
-    def clear_dues(self):
-        for transaction in self.transactions:
-            fine = transaction.calculate_fine(date.today())
-            if fine > 0:
-                transaction.return_date = date.today()
-                print(f"Fine of Rs.{fine} paid successfully for '{transaction.book.title}'.")
-            else:
-                print(f"No fine for '{transaction.book.title}'")
-    
     def view_reservations(self):
         print(f"Reservations for {self.name}:")
         for book in self.reserved_books:
-            print(f" - {book.title}")
+            print(f" - {book.title} (ISBN: {book.isbn})")
     
     def notify(self, message):
         self.notifications.append(message)
     
     def view_notifications(self):
-        if not self.notifications:
+        # swap rather than clear: the next reserver is notified without holding this member's lock
+        notes, self.notifications = self.notifications, []
+        if not notes:
             print("No new notifications.")
         else:
             print(f"Notifications for {self.name}:")
-            for note in self.notifications:
+            for note in notes:
                 print(" -", note)
-        self.notifications.clear()
 
 
 
 
 
-class Library:
+_scan_count = contextvars.ContextVar("scan_count", default=None)
+
+class Metrics:
+    """Per-operation call counts, latency histograms and how many items each call scanned.
+
+    Disabled by default; an instrumented call then costs one attribute check.
+    enable(profile=True) also runs cProfile (in the enabling thread) and
+    enable(memory=True) records each call's tracemalloc peak.
+    """
+
+    BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, float("inf"))  # latency upper bounds, seconds
+
     def __init__(self):
-        self.members = []
-        self.books = []
+        self.enabled = False
+        self._memory = False
+        self._profiler = None
+        self._lock = threading.Lock()
+        self._ops = {}
+
+    def enable(self, profile=False, memory=False):
+        if profile:
+            self._profiler = self._profiler or cProfile.Profile()
+            self._profiler.enable()
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._memory = True
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._profiler is not None:
+            self._profiler.disable()
+        if self._memory:
+            tracemalloc.stop()
+            self._memory = False
+
+    def reset(self):
+        with self._lock:
+            self._ops = {}
+        if self._profiler is not None:
+            self._profiler.clear()
+
+    def count(self, n):
+        """Add n scanned items to the instrumented call in progress, if any."""
+        if self.enabled and (counter := _scan_count.get()) is not None:
+            counter[0] += n
+
+    def record(self, name, elapsed, scanned=None, peak=None):
+        with self._lock:
+            op = self._ops.get(name)
+            if op is None:
+                op = self._ops[name] = {"calls": 0, "total": 0.0, "max": 0.0, "scanned": 0,
+                                        "peak_bytes": 0, "histogram": [0] * len(self.BUCKETS)}
+            op["calls"] += 1
+            op["total"] += elapsed
+            op["max"] = max(op["max"], elapsed)
+            op["histogram"][bisect.bisect_left(self.BUCKETS, elapsed)] += 1
+            if scanned is not None:
+                op["scanned"] += scanned
+            if peak is not None:
+                op["peak_bytes"] = max(op["peak_bytes"], peak)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(op, histogram=list(op["histogram"])) for name, op in self._ops.items()}
+
+    def report(self, fmt="text"):
+        """Metrics as a tabulated text report or a JSON document."""
+        ops = self.snapshot()
+        if fmt == "json":
+            return json.dumps({"buckets": [str(b) for b in self.BUCKETS], "operations": ops}, indent=2)
+        headers = ["Operation", "Calls", "Total ms", "Mean ms", "Max ms", "Mean scanned", "Peak KiB"]
+        headers += [f"<={b * 1e3:g}ms" for b in self.BUCKETS[:-1]] + ["slower"]
+        table = [[name, op["calls"], f"{op['total'] * 1e3:.2f}", f"{op['total'] / op['calls'] * 1e3:.3f}",
+                  f"{op['max'] * 1e3:.3f}", f"{op['scanned'] / op['calls']:.0f}", op["peak_bytes"] // 1024]
+                 + op["histogram"] for name, op in sorted(ops.items())]
+        return tabulate(table, headers=headers)
+
+    def profile_report(self, limit=25, sort="cumulative"):
+        """The top of the cProfile capture, or an empty string when profiling was never enabled."""
+        if self._profiler is None:
+            return ""
+        output = io.StringIO()
+        pstats.Stats(self._profiler, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+metrics = Metrics()
+
+def instrumented(name, scanned=None):
+    """Record calls of the decorated function in `metrics`.
+
+    The work is what the call (and any instrumented call inside it) passed to
+    metrics.count(), or scanned(*args, **kwargs) for functions that always
+    walk a whole collection.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            memory = metrics._memory and tracemalloc.is_tracing()
+            if memory:
+                tracemalloc.reset_peak()
+            counter = [0]
+            token = _scan_count.set(counter)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _scan_count.reset(token)
+                if (outer := _scan_count.get()) is not None:
+                    outer[0] += counter[0]
+                metrics.record(name, elapsed, scanned(*args, **kwargs) if scanned else counter[0],
+                               tracemalloc.get_traced_memory()[1] if memory else None)
+        return wrapper
+    return decorate
+
+
+_captured_output = contextvars.ContextVar("captured_output", default=None)
+
+class _ContextStdout:
+    """sys.stdout stand-in that sends writes to the current context's capture buffer, if any."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        return (_captured_output.get() or self._stream).write(text)
+
+    def flush(self):
+        (_captured_output.get() or self._stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+@contextmanager
+def captured_output():
+    """Collect what the current thread or asyncio task prints.
+
+    Unlike contextlib.redirect_stdout this leaves other threads' output
+    alone, so prints from background workers can't land in the buffer.
+    """
+    if not isinstance(sys.stdout, _ContextStdout):
+        sys.stdout = _ContextStdout(sys.stdout)
+    buffer = io.StringIO()
+    token = _captured_output.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _captured_output.reset(token)
+
+
+class QueryCache:
+    """Bounded LRU of query results, each tagged with the data versions it was computed from.
+
+    A stored result is served only while those versions are unchanged and it
+    is younger than ttl seconds; hits and misses are counted per query name.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, expires, value)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.evictions = 0
+
+    def get(self, key, version):
+        """(True, value) for a current entry, else (False, None)."""
+        with self._lock:
+            stats = self._stats.setdefault(key[0], [0, 0])
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                stats[0] += 1
+                return True, entry[2]
+            if entry is not None:
+                del self._entries[key]
+            stats[1] += 1
+            return False, None
+
+    def put(self, key, version, value):
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hits, misses and hit rate per query name, plus size and evictions."""
+        with self._lock:
+            queries = {name: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                       for name, (hits, misses) in self._stats.items() if hits + misses}
+            return {"size": len(self._entries), "maxsize": self.maxsize, "evictions": self.evictions,
+                    "queries": queries}
+
+    def __getstate__(self):
+        return {"maxsize": self.maxsize, "ttl": self.ttl}
+
+    def __setstate__(self, state):
+        self.__init__(state["maxsize"], state["ttl"])
+
+
+def best_matches(word, buckets, n, cutoff, floor=0.0):
+    """The n best (score, title) pairs of difflib.get_close_matches(word, titles, n, cutoff).
+
+    buckets maps title length -> {title: count}. Lengths are visited best
+    real_quick_ratio bound first, and a title is skipped as soon as a bound
+    falls below the n-th best score so far (or floor, a score n titles are
+    already known to reach), so the result is exact. Returned as a heap.
+    """
+    matcher = difflib.SequenceMatcher()
+    matcher.set_seq2(word)
+    threshold = max(cutoff, floor)
+    top = []
+    bounds = sorted(((2.0 * min(length, len(word)) / (length + len(word)) if length + len(word) else 1.0, titles)
+                     for length, titles in list(buckets.items())), key=lambda pair: pair[0], reverse=True)
+    for bound, titles in bounds:
+        if bound < threshold:
+            break
+        metrics.count(len(titles))
+        for title, count in list(titles.items()):
+            matcher.set_seq1(title)
+            if matcher.quick_ratio() < threshold or (score := matcher.ratio()) < threshold:
+                continue
+            for _ in range(min(count, n)):
+                if len(top) < n:
+                    heapq.heappush(top, (score, title))
+                elif (score, title) > top[0]:
+                    heapq.heapreplace(top, (score, title))
+                else:
+                    break
+            if len(top) == n:
+                threshold = max(threshold, top[0][0])
+    return top
+
+
+_fuzzy_chunk = {}  # this worker process's share of the title buckets, see FuzzyMatcher
+
+def _install_fuzzy_chunk(chunk):
+    global _fuzzy_chunk
+    _fuzzy_chunk = chunk
+
+def _match_fuzzy_chunk(changes, word, n, cutoff, floor):
+    # catch up with the catalog first: changes maps title -> change in count
+    for title, delta in changes.items():
+        titles = _fuzzy_chunk.setdefault(len(title), {})
+        count = titles.get(title, 0) + delta
+        if count > 0:
+            titles[title] = count
+        else:
+            titles.pop(title, None)
+            if not titles:
+                del _fuzzy_chunk[len(title)]
+    return best_matches(word, _fuzzy_chunk, n, cutoff, floor)
+
+
+class FuzzyMatcher:
+    """Exact difflib close matches over the catalog titles, optionally on worker processes.
+
+    With workers > 1 and a large catalog, each title is hashed to one of
+    `workers` single-process executors, which is started with only its own
+    chunk. Catalog changes reported through note() are queued per chunk and
+    sent along with that chunk's next query, so the workers are never
+    restarted. Each returns its own top n, and these are merged.
+    """
+
+    def __init__(self, workers=None, min_parallel=PARALLEL_FUZZY_MIN):
+        self.workers = workers
+        self.min_parallel = min_parallel
+        self._executors = []
+        self._pending = []  # per chunk: title -> change in count not yet sent
+        self._lock = threading.Lock()
+
+    def close_matches(self, word, buckets, lock, n, cutoff, floor=0.0):
+        """Titles as difflib.get_close_matches would rank them.
+
+        lock is held by whoever changes buckets and calls note(); the
+        workers' chunks are copied from buckets under it.
+        """
+        if n <= 0:
+            return []
+        if (self.workers or 1) > 1 and sum(len(titles) for titles in list(buckets.values())) >= self.min_parallel:
+            if not self._executors:
+                with lock:
+                    self._start(buckets)
+            with self._lock:
+                futures = []
+                for executor, changes in zip(self._executors, self._pending):
+                    futures.append(executor.submit(_match_fuzzy_chunk, {t: d for t, d in changes.items() if d},
+                                                   word, n, cutoff, floor))
+                    changes.clear()
+            scored = [pair for future in futures for pair in future.result()]
+        else:
+            scored = best_matches(word, buckets, n, cutoff, floor)
+        return [title for score, title in heapq.nlargest(n, scored)]
+
+    def _chunk_of(self, title):
+        return zlib.crc32(title.encode()) % self.workers
+
+    def _start(self, buckets):
+        with self._lock:
+            if self._executors:
+                return
+            chunks = [{} for _ in range(self.workers)]
+            for length, titles in buckets.items():
+                for title, count in titles.items():
+                    chunks[self._chunk_of(title)].setdefault(length, {})[title] = count
+            self._executors = [ProcessPoolExecutor(1, initializer=_install_fuzzy_chunk, initargs=(chunk,))
+                               for chunk in chunks]
+            self._pending = [Counter() for _ in chunks]
+
+    def note(self, title, delta):
+        """Record that title's count in the buckets changed by delta."""
+        if not self._executors:
+            return  # nothing running; the next start copies the buckets
+        with self._lock:
+            if self._executors:
+                self._pending[self._chunk_of(title)][title] += delta
+
+    def close(self):
+        with self._lock:
+            for executor in self._executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executors = []
+            self._pending = []
+
+    def __getstate__(self):
+        return {"workers": self.workers, "min_parallel": self.min_parallel}
+
+    def __setstate__(self, state):
+        self.__init__(state["workers"], state["min_parallel"])
+
+
+def cached(name, key, depends):
+    """Serve a Library query from its query_cache while the `depends` versions are unchanged.
+
+    key(*args, **kwargs) normalizes the arguments; cached lists are copied
+    on the way out so callers can't change them.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            cache = self.query_cache
+            if not cache.maxsize:
+                return func(self, *args, **kwargs)
+            cache_key = (name, key(*args, **kwargs))
+            version = tuple(self._versions[kind] for kind in depends)
+            hit, value = cache.get(cache_key, version)
+            if not hit:
+                value = func(self, *args, **kwargs)
+                cache.put(cache_key, version, value)
+            return list(value) if isinstance(value, list) else value
+        return wrapper
+    return decorate
+
+
+class OutboxEvent:
+    __slots__ = ("id", "email", "message", "created", "status", "attempts")
+
+    def __init__(self, event_id, email, message, created, status="pending", attempts=0):
+        self.id = event_id
+        self.email = email
+        self.message = message
+        self.created = created
+        self.status = status
+        self.attempts = attempts
+
+
+class FileDelivery:
+    """Stand-in mail transport: appends each batch to a local file."""
+
+    def __init__(self, path="notifications.log"):
+        self.path = path
+
+    def __call__(self, email, messages):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(f"{time.strftime('%Y-%m-%dT%H:%M:%S')}\t{email}\t" + " | ".join(messages) + "\n")
+
+
+class SMTPDelivery:
+    """Sends one email per recipient batch through an SMTP relay."""
+
+    def __init__(self, host="localhost", port=25, sender="library@localhost"):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def __call__(self, email, messages):
+        body = "\n".join(f"- {message}" for message in messages)
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            smtp.sendmail(self.sender, [email], f"Subject: Library notifications\n\n{body}\n")
+
+
+class NotificationOutbox:
+    """Durable queue of notification events, delivered in batches off the circulation path.
+
+    put() only appends an event, which the caller records together with the
+    change that caused it. A worker thread (start/stop) takes up to
+    batch_size events, coalesces them into one delivery per recipient and
+    records each event as delivered; failures are retried with exponential
+    backoff and marked failed after max_attempts.
+    """
+
+    def __init__(self, deliver=None, batch_size=100, max_attempts=5, retry_delay=1.0, clock=date.today):
+        self.deliver = deliver or FileDelivery()
+        self.clock = clock
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.pending = {}  # event id -> OutboxEvent, oldest first
+        self.next_id = 0
+        self._retry_at = {}  # event id -> monotonic time it may be retried
+        self._record = None
+        self._init_worker()
+
+    def _init_worker(self):
+        self._wakeup = threading.Condition()
+        # one flush at a time, or a manual flush and the worker could take and deliver the same events
+        self._flushing = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_wakeup", "_flushing", "_thread", "_stopping", "_record"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("clock", date.today)
+        self._record = None
+        self._init_worker()
+
+    def put(self, email, message):
+        with self._wakeup:
+            event = OutboxEvent(self.next_id, email, message, self.clock())
+            self.next_id += 1
+            self.pending[event.id] = event
+            self._wakeup.notify()
+        return event
+
+    def apply(self, event):
+        """Load a stored event; only pending ones are kept."""
+        with self._wakeup:
+            self.next_id = max(self.next_id, event.id + 1)
+            if event.status == "pending":
+                self.pending[event.id] = event
+            else:
+                self.pending.pop(event.id, None)
+
+    def _take_batch(self):
+        now = time.monotonic()
+        batch = []
+        for event in self.pending.values():
+            if self._retry_at.get(event.id, 0) <= now:
+                batch.append(event)
+                if len(batch) == self.batch_size:
+                    break
+        return batch
+
+    def flush(self):
+        """Deliver one batch now; returns how many events were delivered."""
+        with self._flushing:
+            return self._flush()
+
+    def _flush(self):
+        with self._wakeup:
+            batch = self._take_batch()
+        by_email = {}
+        for event in batch:
+            by_email.setdefault(event.email, []).append(event)
+        finished = []
+        for email, events in by_email.items():
+            try:
+                self.deliver(email, [event.message for event in events])
+            except Exception as e:
+                for event in events:
+                    event.attempts += 1
+                    if event.attempts < self.max_attempts:
+                        self._retry_at[event.id] = time.monotonic() + self.retry_delay * 2 ** (event.attempts - 1)
+                    else:
+                        event.status = "failed"
+                        finished.append(event)
+                        print(f"Giving up on notification {event.id} to {email}: {e}")
+                continue
+            for event in events:
+                event.status = "delivered"
+                finished.append(event)
+        with self._wakeup:
+            for event in finished:
+                self.pending.pop(event.id, None)
+                self._retry_at.pop(event.id, None)
+        if finished and self._record is not None:
+            self._record(*(("outbox", event) for event in finished))
+        return sum(event.status == "delivered" for event in finished)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._stopping and not self._take_batch():
+                    # sleep until new work arrives or the earliest retry is due
+                    retry = min(self._retry_at.values(), default=None)
+                    self._wakeup.wait(None if retry is None else max(0.0, retry - time.monotonic()))
+                if self._stopping:
+                    return
+            self.flush()
+
+    def start(self, record=None):
+        """Deliver on a daemon thread; record(*changes) persists status changes."""
+        self._record = record
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="notification-outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self, drain=True):
+        if self._thread is not None:
+            with self._wakeup:
+                self._stopping = True
+                self._wakeup.notify()
+            self._thread.join()
+            self._thread = None
+        if drain:
+            while self.flush():
+                pass
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class SimulatedClock:
+    """A settable stand-in for date.today, for driving the scheduler in tests."""
+
+    def __init__(self, today=None):
+        self.today = today or date.today()
+
+    def __call__(self):
+        return self.today
+
+    def advance(self, days=1):
+        self.today += timedelta(days=days)
+        return self.today
+
+
+class Scheduler:
+    """Timers keyed by (kind, key) in a min-heap ordered by the day they fire.
+
+    Rescheduling or cancelling leaves the old heap entry behind to be skipped
+    when it surfaces, so schedule, cancel and each fired timer are O(log n).
+    """
+
+    def __init__(self, clock=date.today):
+        self.clock = clock
+        self._heap = []
+        self._live = {}  # (kind, key) -> sequence number of its current heap entry
+        self._seq = itertools.count()
+
+    def schedule(self, kind, key, when):
+        seq = next(self._seq)
+        self._live[(kind, key)] = seq
+        heapq.heappush(self._heap, (when, seq, kind, key))
+        if len(self._heap) > 2 * len(self._live) + 1024:
+            # drop stale entries once they outnumber the live ones
+            self._heap = [entry for entry in self._heap if self._live.get(entry[2:]) == entry[1]]
+            heapq.heapify(self._heap)
+
+    def cancel(self, kind, key):
+        return self._live.pop((kind, key), None) is not None
+
+    def pop_due(self, now=None):
+        """Remove and yield (kind, key, when) for every live timer due by now."""
+        now = now or self.clock()
+        while self._heap and self._heap[0][0] <= now:
+            when, seq, kind, key = heapq.heappop(self._heap)
+            if self._live.get((kind, key)) == seq:
+                del self._live[(kind, key)]
+                yield kind, key, when
+
+    def __len__(self):
+        return len(self._live)
+
+
+class LockTable:
+    """Re-entrant locks keyed by name, created on first use."""
+
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def __call__(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, threading.RLock())
+        return lock
+
+
+class Roster(Sequence):
+    """An insertion-ordered list of books or members with O(1) remove.
+
+    Removal leaves a hole and the slots are compacted once holes outnumber
+    entries. Writers hold the catalog lock; readers iterate without it, so
+    compaction swaps in a fresh list instead of editing the one in use.
+    """
+
+    _HOLE = object()
+
+    def __init__(self, items=()):
+        self._items = list(items)
+        self._slots = {id(item): i for i, item in enumerate(self._items)}
+        self._holes = 0
+
+    def append(self, item):
+        self._slots[id(item)] = len(self._items)
+        self._items.append(item)
+
+    def remove(self, item):
+        try:
+            slot = self._slots.pop(id(item))
+        except KeyError:
+            raise ValueError("Roster.remove(x): x not in roster") from None
+        # count the hole first, so a reader never indexes past it unawares
+        self._holes += 1
+        self._items[slot] = self._HOLE
+        if self._holes > len(self._slots):
+            self._compact()
+
+    def _compact(self):
+        items = [item for item in self._items if item is not self._HOLE]
+        self._slots = {id(item): i for i, item in enumerate(items)}
+        self._items, self._holes = items, 0
+
+    def __len__(self):
+        return len(self._items) - self._holes
+
+    def __iter__(self):
+        return (item for item in self._items if item is not self._HOLE)
+
+    def __contains__(self, item):
+        return id(item) in self._slots
+
+    def __getitem__(self, i):
+        # positions shift past a hole; a reader can't compact in place, so index a snapshot
+        return (self._items if not self._holes else list(self))[i]
+
+    def __reduce__(self):
+        return type(self), (list(self),)
+
+    def __repr__(self):
+        return f"Roster({list(self)!r})"
+
+
+class PopularityRanking:
+    """Items bucketed by count so an increment is O(1) and top-N reads walk the fullest buckets."""
+
+    def __init__(self):
+        self.counts = {}
+        self._buckets = {}
+        self._levels = []  # distinct counts, ascending
+
+    def _place(self, item, count):
+        if count not in self._buckets:
+            self._buckets[count] = {}
+            bisect.insort(self._levels, count)
+        self._buckets[count][item] = None
+        self.counts[item] = count
+
+    def _unplace(self, item):
+        count = self.counts.pop(item)
+        bucket = self._buckets[count]
+        del bucket[item]
+        if not bucket:
+            del self._buckets[count]
+            del self._levels[bisect.bisect_left(self._levels, count)]
+        return count
+
+    def register(self, item):
+        if item not in self.counts:
+            self._place(item, 0)
+
+    def increment(self, item):
+        count = self._unplace(item) if item in self.counts else 0
+        self._place(item, count + 1)
+
+    def discard(self, item):
+        if item in self.counts:
+            self._unplace(item)
+
+    def top(self, n, exclude=()):
+        """Up to n items, most counted first; ties keep the order they reached that count."""
+        picked = []
+        for count in reversed(self._levels):
+            for item in self._buckets[count]:
+                if item not in exclude:
+                    picked.append(item)
+                    if len(picked) == n:
+                        return picked
+        return picked
+
+
+class Recommender:
+    """Co-borrow similarity and per-genre popularity, updated on every borrow."""
+
+    def __init__(self):
+        self.co_borrows = {}  # book -> Counter of books borrowed by the same members
+        self.history = {}     # member -> books ever borrowed
+        self.recent = {}      # member -> deque of the last CO_BORROW_WINDOW distinct books
+        self.genres = {}      # member -> Counter of genres borrowed
+        self.popular = {}     # genre -> PopularityRanking of books
+
+    def register(self, book):
+        self.popular.setdefault(book.genre, PopularityRanking()).register(book)
+
+    def discard(self, book):
+        if ranking := self.popular.get(book.genre):
+            ranking.discard(book)
+        # co-borrow counts are symmetric, so this finds every mention of book;
+        # a removed book left in a recent deque then scores nothing
+        for other in self.co_borrows.pop(book, {}):
+            if neighbours := self.co_borrows.get(other):
+                neighbours.pop(book, None)
+
+    def record_borrow(self, member, book):
+        history = self.history.setdefault(member, set())
+        if book not in history:
+            recent = self.recent.setdefault(member, deque(maxlen=CO_BORROW_WINDOW))
+            neighbours = self.co_borrows.setdefault(book, Counter())
+            for other in recent:
+                neighbours[other] += 1
+                self.co_borrows.setdefault(other, Counter())[book] += 1
+            history.add(book)
+            recent.append(book)
+            if book.genre:
+                self.genres.setdefault(member, Counter())[book.genre] += 1
+        self.count_borrow(book)
+
+    def count_borrow(self, book):
+        """Count one borrow of a catalogued book towards its genre's popularity."""
+        if ranking := self.popular.get(book.genre):
+            if book in ranking.counts:
+                ranking.increment(book)
+
+    def co_borrowed(self, member, n, skip):
+        """Up to n books co-borrowed with the member's recent borrows, best first."""
+        scores = Counter()
+        for book in self.recent.get(member, ()):
+            neighbours = self.co_borrows.get(book, {})
+            metrics.count(len(neighbours))
+            for other, count in neighbours.items():
+                if other not in skip:
+                    scores[other] += count
+        return [book for book, score in scores.most_common(n)]
+
+    def favourite_genre(self, member):
+        genres = self.genres.get(member)
+        return genres.most_common(1)[0][0] if genres else None
+
+    def recommend(self, member, n, exclude):
+        """Books co-borrowed with the member's recent borrows, then the favourite genre's most borrowed."""
+        skip = set(exclude) | self.history.get(member, set())
+        picked = self.co_borrowed(member, n, skip)
+        if len(picked) < n and (fav_genre := self.favourite_genre(member)):
+            if ranking := self.popular.get(fav_genre):
+                picked += ranking.top(n - len(picked), skip | set(picked))
+        return picked
+
+
+class Library:
+    # Lock order: _catalog_lock, then a member lock, then a book lock, then
+    # _history_lock. Searches and exact-key lookups take no locks; they only
+    # read index snapshots taken by single C-level operations.
+
+    def __init__(self, storage=None, compact=False, clock=date.today, fuzzy_workers=None):
+        self.storage = storage if storage is not None else PickleStorage()
+        self.compact = compact
+        self.members = Roster()
+        self.books = Roster()
         self.librarian = None
-        self.transactions = []
+        self.transactions = TransactionStore() if compact else []
+        # the compact store is its own id index
+        self._transactions_by_id = self.transactions if compact else {}
+        self._next_transaction_id = 0
+        # open transactions by (member, book) and per member, in borrow order
+        self._open_loans = {}
+        self._member_loans = {}
+        self._fine_columns = self._new_fine_columns()
+        self._ledger = FineLedger()
+        # every "today" (loans, fines, dues, timers) comes from this; pass a SimulatedClock to drive it by hand
+        self.clock = clock
+        self.outbox = NotificationOutbox(clock=clock)
+        self.scheduler = Scheduler(clock)
+        self._recommender = Recommender()
+        # bumped on every change to the catalog, the member list and loans; see QueryCache
+        self._versions = {"books": 0, "members": 0, "loans": 0}
+        self.query_cache = QueryCache()
+        # fuzzy_workers > 1 matches typo'd titles on a process pool for large catalogs
+        self.fuzzy = FuzzyMatcher(fuzzy_workers)
+        # removed books/members still referenced by old transactions
+        self._removed_books = {}
+        self._removed_members = {}
+        # session token -> (member, expiry on the monotonic clock)
+        self._sessions = {}
+        self._next_session_sweep = 0.0
+        # a lazy store loads open loans only; closed history is fetched per member by load_history
+        self._history_complete = True
+        self._history_members = set()
+        self._init_locks()
+        # exact-key indexes, kept in sync by _add_*/_remove_*
+        self._books_by_isbn = {}
+        self._books_by_title = {}
+        self._members_by_email = {}
+        # search indexes: token -> books, n-gram -> tokens, title length -> titles,
+        # title trigram -> titles
+        self._token_postings = {}
+        self._token_grams = {}
+        self._titles_by_length = {}
+        self._title_grams = {}
+        self._book_seq = {}
+        self._next_book_seq = 0
+
+    def _bump(self, *kinds):
+        """Invalidate cached queries that depend on these kinds of data."""
+        with self._history_lock:
+            for kind in kinds:
+                self._versions[kind] += 1
+
+    # Both bump only after the indexes have changed: a search that overlaps
+    # the change read the old version, so its cached result is already stale.
+    def _index_book(self, book):
+        self._books_by_isbn[normalize_key(book.isbn)] = book
+        self._books_by_title.setdefault(normalize_key(book.title), []).append(book)
+        self._book_seq[book] = self._next_book_seq
+        self._next_book_seq += 1
+        for token in book_tokens(book):
+            if token not in self._token_postings:
+                self._token_postings[token] = set()
+                for gram in ngrams(token):
+                    self._token_grams.setdefault(gram, set()).add(token)
+            self._token_postings[token].add(book)
+        self._titles_by_length.setdefault(len(book.title), Counter())[book.title] += 1
+        self.fuzzy.note(book.title, 1)
+        for gram in title_trigrams(book.title):
+            self._title_grams.setdefault(gram, Counter())[book.title] += 1
+        with self._history_lock:
+            self._recommender.register(book)
+        self._bump("books")
+
+    def _unindex_book(self, book):
+        self._books_by_isbn.pop(normalize_key(book.isbn), None)
+        key = normalize_key(book.title)
+        same_title = self._books_by_title.get(key, [])
+        if book in same_title:
+            same_title.remove(book)
+        if not same_title:
+            self._books_by_title.pop(key, None)
+        self._book_seq.pop(book, None)
+        for token in book_tokens(book):
+            postings = self._token_postings.get(token)
+            if postings is None:
+                continue
+            postings.discard(book)
+            if not postings:
+                del self._token_postings[token]
+                for gram in ngrams(token):
+                    tokens = self._token_grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._token_grams[gram]
+        titles = self._titles_by_length[len(book.title)]
+        titles[book.title] -= 1
+        if titles[book.title] <= 0:
+            del titles[book.title]
+        if not titles:
+            del self._titles_by_length[len(book.title)]
+        self.fuzzy.note(book.title, -1)
+        for gram in title_trigrams(book.title):
+            titles = self._title_grams[gram]
+            titles[book.title] -= 1
+            if titles[book.title] <= 0:
+                del titles[book.title]
+            if not titles:
+                del self._title_grams[gram]
+        with self._history_lock:
+            self._recommender.discard(book)
+        self._bump("books")
+
+    def _rebuild_indexes(self):
+        self.fuzzy.close()  # its workers hold the old titles
+        self._books_by_isbn = {}
+        self._books_by_title = {}
+        self._members_by_email = {}
+        self._token_postings = {}
+        self._token_grams = {}
+        self._titles_by_length = {}
+        self._title_grams = {}
+        self._book_seq = {}
+        self._next_book_seq = 0
+        self._recommender = Recommender()
+        self.query_cache.clear()
+        self._bump("books", "members", "loans")
+        # pickles from before the Roster hold plain lists
+        self.books, self.members = Roster(self.books), Roster(self.members)
+        for book in self.books:
+            self._index_book(book)
+        for member in self.members:
+            self._members_by_email[normalize_key(member.email)] = member
+        if self.compact and not isinstance(self.transactions, TransactionStore):
+            history, self.transactions = self.transactions, TransactionStore()
+            for i, t in enumerate(history):
+                t.id = i
+                self.transactions.append(t)
+        if self.compact:
+            # member histories are row ids (pickles may hold Transaction objects or one view per loan)
+            for member in self.transactions.members:
+                if not isinstance(member.transactions, TransactionRows):
+                    member.transactions = TransactionRows(self.transactions, (t.id for t in member.transactions))
+        self._transactions_by_id = self.transactions if self.compact else {}
+        self._open_loans = {}
+        self._member_loans = {}
+        self._fine_columns = self._new_fine_columns()
+        if self._ledger is None:
+            # history from before the ledger is settled: clear_dues used to record payments by
+            # rewriting return dates, so its late returns can't be told apart from paid ones
+            self._ledger = FineLedger()
+        self._ledger.clear_open()
+        self.scheduler = Scheduler(self.clock)
+        for book in self.books:
+            for member, until in book.holds.items():
+                self._schedule_hold_expiry(book, member, until)
+        self._removed_books = {}
+        self._removed_members = {}
+        self._next_transaction_id = max((t.id for t in self.transactions if t.id is not None), default=-1) + 1
+        for t in self.transactions:
+            if t.id is None:
+                t.id = self._next_transaction_id
+                self._next_transaction_id += 1
+            if not self.compact:
+                self._transactions_by_id[t.id] = t
+            self._update_fine_columns(t)
+            self._recommender.record_borrow(t.member, t.book)
+            if t.return_date is None:
+                self._open_loan(t)
+            if self.get_book_by_isbn(t.book.isbn) is not t.book:
+                self._removed_books[normalize_key(t.book.isbn)] = t.book
+            if self.get_member_by_email(t.member.email) is not t.member:
+                self._removed_members[normalize_key(t.member.email)] = t.member
+
+    def _open_loan(self, transaction):
+        self._open_loans.setdefault((transaction.member, transaction.book), []).append(transaction)
+        self._member_loans.setdefault(transaction.member, {})[transaction] = None
+        with self._history_lock:
+            self._versions["loans"] += 1
+            self._ledger.open(transaction)
+            self._schedule_reminder(transaction)
+
+    def _close_loan(self, transaction):
+        key = (transaction.member, transaction.book)
+        loans = self._open_loans.get(key, [])
+        if transaction in loans:
+            loans.remove(transaction)
+            if not loans:
+                del self._open_loans[key]
+        member_loans = self._member_loans.get(transaction.member, {})
+        member_loans.pop(transaction, None)
+        if not member_loans:
+            self._member_loans.pop(transaction.member, None)
+        with self._history_lock:
+            self._versions["loans"] += 1
+            self._ledger.close(transaction)
+            self.scheduler.cancel("overdue", transaction.id)
+
+    def _schedule_reminder(self, transaction):
+        """Remind the day after the due date, then every REMINDER_DAYS, starting no earlier than today."""
+        first = transaction.due_date + timedelta(days=1)
+        late = (self.today() - first).days
+        if late > 0:
+            first += timedelta(days=-(-late // REMINDER_DAYS) * REMINDER_DAYS)
+        with self._history_lock:
+            self.scheduler.schedule("overdue", transaction.id, first)
+
+    def _schedule_hold_expiry(self, book, member, until):
+        with self._history_lock:
+            self.scheduler.schedule("hold", (normalize_key(book.isbn), normalize_key(member.email)),
+                                    until + timedelta(days=1))
+
+    def _offer_hold(self, book, today):
+        """Hold the copy for the next reserver; returns the changes to record."""
+        until = today + timedelta(days=HOLD_DAYS)
+        if (served := book.notify_next_reserver(hold_until=until)) is None:
+            return []
+        next_member, message = served
+        self._schedule_hold_expiry(book, next_member, until)
+        return [("member", next_member), ("outbox", self.outbox.put(next_member.email, message))]
+
+    def run_scheduler(self, now=None):
+        """Send the overdue reminders and expire the holds that are due by now; returns how many fired."""
+        now = now or self.today()
+        with self._history_lock:
+            due = list(self.scheduler.pop_due(now))
+        for kind, key, when in due:
+            if kind == "overdue":
+                self._remind_overdue(key, now)
+            elif kind == "hold":
+                self._expire_hold(*key, now)
+        return len(due)
+
+    def _remind_overdue(self, transaction_id, now):
+        transaction = self._transactions_by_id.get(transaction_id)
+        if transaction is None:
+            return
+        member = transaction.member
+        with self._circulation_lock(member):
+            if transaction.return_date is not None:
+                return
+            message = (f"'{transaction.book.title}' was due on {transaction.due_date}. "
+                       f"Fine so far: Rs.{transaction.calculate_fine(now)}.")
+            member.notify(message)
+            self._record(("member", member), ("outbox", self.outbox.put(member.email, message)))
+            with self._history_lock:
+                self.scheduler.schedule("overdue", transaction_id, now + timedelta(days=REMINDER_DAYS))
+
+    def _expire_hold(self, isbn_key, email_key, now):
+        book = self._lookup_book(isbn_key)
+        member = self._lookup_member(email_key)
+        if book is None or member is None:
+            return
+        with self._circulation_lock(member, book):
+            until = book.holds.get(member)
+            if until is None or until >= now:
+                return
+            del book.holds[member]
+            message = f"Your hold on '{book.title}' has expired."
+            member.notify(message)
+            changes = [("member", member), ("outbox", self.outbox.put(member.email, message))]
+            changes += self._offer_hold(book, now)
+            self._record(("book", book), *changes)
+
+    def today(self):
+        """The library's current date, from its clock."""
+        return self.clock()
+
+    def _ledger_entry(self, member, kind, amount, transaction=None):
+        """Append a fine or payment to the ledger and return it for recording."""
+        with self._history_lock:
+            entry = LedgerEntry(self._ledger.next_id, member, kind, amount, self.today(),
+                                None if transaction is None else transaction.id)
+            self._ledger.apply(entry)
+        return entry
+
+    def outstanding_fine(self, member, as_of=None):
+        """Unpaid fines on returned books plus what the member's overdue loans have accrued."""
+        as_of = as_of or self.today()
+        with self._history_lock:
+            return self._ledger.balances.get(member, 0.0) + sum(
+                max(0.0, t.calculate_fine(as_of) - self._ledger.prepaid.get(t.id, 0.0))
+                for t in self._member_loans.get(member, ()))
+
+    def overdue_loans(self, as_of=None):
+        """Open loans past their due date, most overdue first."""
+        with self._history_lock:
+            return list(self._ledger.overdue(as_of or self.today()))
+
+    def open_loans(self, member):
+        return list(self._member_loans.get(member, ()))
+
+    def _new_fine_columns(self):
+        if np is None:
+            return None
+        return self.transactions if self.compact else FineColumns()
+
+    def _update_fine_columns(self, transaction):
+        if self._fine_columns is not None:
+            with self._history_lock:
+                self._fine_columns.update(transaction)
+
+    def load_history(self, members=None):
+        """Fetch the closed transactions a lazy store left on disk, for `members` or everyone."""
+        if self._history_complete:
+            return
+        with self._history_lock:
+            if members is not None:
+                members = [m for m in members if normalize_key(m.email) not in self._history_members]
+                if not members:
+                    return
+            records = self.storage.load_history(None if members is None else [m.email for m in members])
+            for record in records:
+                self._apply_change("transaction", record)
+            touched = {t.member for t in self.transactions} if members is None else members
+            for member in touched:
+                member.transactions.sort(key=lambda t: t.id)
+            if members is None:
+                self.transactions.sort(key=lambda t: t.id)
+                self._history_complete = True
+            else:
+                self._history_members.update(normalize_key(m.email) for m in members)
+
+    @instrumented("compute_fines", lambda self, as_of, members=None: len(self.transactions))
+    def compute_fines(self, as_of, members=None):
+        """Fines of all transactions (or those of `members`) on `as_of`.
+
+        Returns (transaction_ids, fines) as arrays, computed in one vectorized
+        pass with the same rule as Transaction.calculate_fine.
+        """
+        self.load_history(members)
+        transactions = None if members is None else [t for m in members for t in m.transactions]
+        if self._fine_columns is None:
+            transactions = self.transactions if transactions is None else transactions
+            return [t.id for t in transactions], [t.calculate_fine(as_of) for t in transactions]
+        ids = None if transactions is None else np.array([t.id for t in transactions], dtype=np.int64)
+        return self._fine_columns.fines(as_of, ids)
+
+    def _init_locks(self):
+        self._catalog_lock = threading.RLock()
+        self._history_lock = threading.RLock()
+        self._member_locks = LockTable()
+        self._book_locks = LockTable()
+
+    @contextmanager
+    def _circulation_lock(self, member, book=None):
+        with self._member_locks(normalize_key(member.email)):
+            if book is None:
+                yield
+            else:
+                with self._book_locks(normalize_key(book.isbn)):
+                    yield
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["storage"] = None
+        for name in ("_catalog_lock", "_history_lock", "_member_locks", "_book_locks", "_sessions",
+                     "_next_session_sweep", "scheduler"):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("clock", date.today)
+        self._sessions = {}
+        self._next_session_sweep = 0.0
+        self.scheduler = Scheduler(self.clock)
+        self._init_locks()
+
+    def _record(self, *changes):
+        """Hand (kind, object) changes to the storage backend as one unit."""
+        if self.storage is not None:
+            # records always say "not removed"; keep books and members outside the catalog out of it
+            changes += tuple(("remove_book", obj) for kind, obj in changes
+                             if kind == "book" and self.get_book_by_isbn(obj.isbn) is not obj)
+            changes += tuple(("remove_member", obj) for kind, obj in changes
+                             if kind == "member" and self.get_member_by_email(obj.email) is not obj)
+            self.storage.write(changes)
+
+    def _lookup_book(self, isbn):
+        return self.get_book_by_isbn(isbn) or self._removed_books.get(normalize_key(isbn))
+
+    def _lookup_member(self, email):
+        return self.get_member_by_email(email) or self._removed_members.get(normalize_key(email))
+
+    def _apply_change(self, kind, record):
+        """Upsert one storage record (see book_record etc.) into the live object graph."""
+        if kind == "book":
+            book = self._lookup_book(record["isbn"])
+            if book is None:
+                book = Book(record["title"], record["author"], record["isbn"], record["genre"],
+                            record["description"], total_copies=record["total_copies"])
+                self._removed_books[normalize_key(book.isbn)] = book
+            book.total_copies = record["total_copies"]
+            book.available_copies = record["available_copies"]
+            book.reservation_queue = ReservationQueue()
+            for entry in record["reservations"]:
+                email, tier = (entry, 0) if isinstance(entry, str) else entry
+                if member := self._lookup_member(email):
+                    book.reservation_queue.append(member, tier)
+            book.holds = {}
+            for email, until in record.get("holds", ()):
+                if member := self._lookup_member(email):
+                    book.holds[member] = date.fromisoformat(until)
+                    self._schedule_hold_expiry(book, member, book.holds[member])
+            listed = self.get_book_by_isbn(book.isbn) is book
+            if record["removed"] and listed:
+                self._detach_book(book)
+            elif not record["removed"] and not listed:
+                self._removed_books.pop(normalize_key(book.isbn), None)
+                self.books.append(book)
+                self._index_book(book)
+        elif kind == "member":
+            member = self._lookup_member(record["email"])
+            if member is None:
+                member = Member(record["name"], record["age"], record["email"], record["password"], hashed=True)
+                self._removed_members[normalize_key(member.email)] = member
+            member.name = record["name"]
+            member.age = record["age"]
+            member.password = record["password"]
+            member.borrowed_books = [b for b in map(self._lookup_book, record["borrowed"]) if b]
+            member.reserved_books = [b for b in map(self._lookup_book, record["reserved"]) if b]
+            member.notifications = list(record["notifications"])
+            self._bump("members")
+            listed = self.get_member_by_email(member.email) is member
+            if record["removed"] and listed:
+                self._detach_member(member)
+            elif not record["removed"] and not listed:
+                self._removed_members.pop(normalize_key(member.email), None)
+                self.members.append(member)
+                self._members_by_email[normalize_key(member.email)] = member
+        elif kind == "transaction":
+            transaction = self._transactions_by_id.get(record["id"])
+            if transaction is None:
+                member = self._lookup_member(record["email"])
+                book = self._lookup_book(record["isbn"])
+                transaction = Transaction(member, book, date.fromisoformat(record["borrow_date"]))
+                transaction.id = record["id"]
+                transaction = self._store_transaction(transaction)
+                member.add_transaction(transaction)
+            was_open = transaction.return_date is None
+            return_date = record["return_date"]
+            transaction.return_date = date.fromisoformat(return_date) if return_date else None
+            if was_open and transaction.return_date is not None:
+                self._close_loan(transaction)
+            elif not was_open and transaction.return_date is None:
+                self._open_loan(transaction)
+            self._update_fine_columns(transaction)
+        elif kind == "ledger":
+            with self._history_lock:
+                if record["id"] not in self._ledger.ids:
+                    self._ledger.apply(LedgerEntry(
+                        record["id"], self._lookup_member(record["email"]), record["kind"], record["amount"],
+                        date.fromisoformat(record["date"]), record["transaction"]))
+        elif kind == "outbox":
+            self.outbox.apply(OutboxEvent(record["id"], record["email"], record["message"],
+                                          date.fromisoformat(record["created"]), record["status"],
+                                          record["attempts"]))
+        elif kind == "remove_book":
+            if book := self.get_book_by_isbn(record):
+                self._detach_book(book)
+        elif kind == "remove_member":
+            if member := self.get_member_by_email(record):
+                self._detach_member(member)
+
+    def _load_records(self, books, members, transactions, ledger=(), outbox=()):
+        """Bulk-load storage records; reservations and holds are applied once members exist."""
+        for record in books:
+            self._apply_change("book", dict(record, reservations=[], holds=[]))
+        for record in members:
+            self._apply_change("member", record)
+        for record in transactions:
+            self._apply_change("transaction", record)
+        for record in ledger:
+            self._apply_change("ledger", record)
+        for record in outbox:
+            self._apply_change("outbox", record)
+        for record in books:
+            if record["reservations"] or record.get("holds"):
+                self._apply_change("book", record)
+
+    def get_book_by_isbn(self, isbn):
+        return self._books_by_isbn.get(normalize_key(isbn))
+
+    def get_books_by_title(self, title):
+        return list(self._books_by_title.get(normalize_key(title), []))
+
+    def get_member_by_email(self, email):
+        return self._members_by_email.get(normalize_key(email))
+
+    def _find_book(self, title_or_isbn):
+        """Exact ISBN, then exact title, then the regular search."""
+        if book := self.get_book_by_isbn(title_or_isbn):
+            return book
+        if same_title := self._books_by_title.get(normalize_key(title_or_isbn)):
+            return same_title[0]
+        books = self.search_book(title_or_isbn)
+        return books[0] if books else None
+
+    USER_SORT_KEYS = {"name": lambda u: u.name.lower(), "age": lambda u: u.age, "email": lambda u: u.email.lower()}
+    BOOK_SORT_KEYS = {"title": lambda b: b.title.lower(), "author": lambda b: b.author.lower(),
+                      "isbn": lambda b: b.isbn, "available": lambda b: b.available_copies}
+    TRANSACTION_SORT_KEYS = {"borrow_date": lambda t: t.borrow_date, "due_date": lambda t: t.due_date,
+                             "member": lambda t: t.member.name.lower(), "title": lambda t: t.book.title.lower()}
+
+    def _show_page(self, headers, items, to_row, offset, limit, key=None, reverse=False, stream=False):
+        """Render one page of items; returns the offset of the next page, or None at the end."""
+        more = False
+        items = paginate(items, offset, None if limit is None else limit + 1, key, reverse)
+        if limit is not None:
+            items = list(items)
+            more = len(items) > limit
+            del items[limit:]
+        show_rows(headers, map(to_row, items), stream)
+        return offset + limit if more else None
+
+    def authenticate(self, email, password):
+        """The member whose email and password match, else None.
+
+        Plaintext passwords from older libraries are replaced by a hash on
+        the first successful login.
+        """
+        member = self.get_member_by_email(email)
+        if member is None:
+            check_password(DUMMY_PASSWORD_HASH, password)
+            return None
+        if not check_password(member.password, password):
+            return None
+        if not is_password_hash(member.password):
+            member.password = hash_password(password)
+            self._record(("member", member))
+        return member
+
+    def login(self, email, password):
+        """Authenticate once and return a session token usable until SESSION_TTL passes."""
+        member = self.authenticate(email, password)
+        if member is None:
+            return None
+        token = secrets.token_urlsafe(24)
+        now = time.monotonic()
+        if now >= self._next_session_sweep:
+            # tokens nobody presents again are never popped by session_member
+            self._next_session_sweep = now + SESSION_SWEEP
+            for old, (_, expires) in list(self._sessions.items()):
+                if expires < now:
+                    self._sessions.pop(old, None)
+        self._sessions[token] = (member, now + SESSION_TTL)
+        return token
+
+    def session_member(self, token):
+        """The member behind a live session token, without re-checking the password."""
+        member, expires = self._sessions.get(token, (None, 0))
+        if member is None or expires < time.monotonic():
+            self._sessions.pop(token, None)
+            return None
+        return member
+
+    def end_sessions(self, member):
+        for token, (owner, _) in list(self._sessions.items()):
+            if owner is member:
+                self._sessions.pop(token, None)
 
-    def print_users(self):
-        table = [[u.name, u.age, u.email] for u in self.members]
-        print(tabulate(table, headers=["Name", "Age", "Email"]))
+    def print_users(self, offset=0, limit=PAGE_SIZE, sort=None, reverse=False, stream=False):
+        """Print a page of members; sort is one of USER_SORT_KEYS."""
+        return self._show_page(["Name", "Age", "Email"], iter(self.members), lambda u: [u.name, u.age, u.email],
+                               offset, limit, self.USER_SORT_KEYS[sort] if sort else None, reverse, stream)
 
-    def print_books(self):
-        table = [[b.title, b.author, b.isbn, f"{b.available_copies}/{b.total_copies}"] for b in self.books]
-        print(tabulate(table, headers=["Title", "Author", "ISBN", "Available/Total"]))
+    def print_books(self, offset=0, limit=PAGE_SIZE, sort=None, reverse=False, stream=False):
+        """Print a page of books; sort is one of BOOK_SORT_KEYS."""
+        return self._show_page(["Title", "Author", "ISBN", "Available/Total"], iter(self.books),
+                               lambda b: [b.title, b.author, b.isbn, f"{b.available_copies}/{b.total_copies}"],
+                               offset, limit, self.BOOK_SORT_KEYS[sort] if sort else None, reverse, stream)
 
 
+    def _substring_candidates(self, q):
+        """Books holding a token that contains the longest whitespace-free piece of q.
+
+        Any substring match of q inside a field puts each of q's pieces inside
+        a single token of that field, so this is a superset of the matches.
+        """
+        piece = max(q.split(), key=len)
+        if len(piece) <= NGRAM_SIZE:
+            tokens = set(self._token_grams.get(piece, ()))
+        else:
+            grams = sorted((self._token_grams.get(piece[i:i + NGRAM_SIZE], set())
+                            for i in range(len(piece) - NGRAM_SIZE + 1)), key=len)
+            tokens = {token for token in grams[0].intersection(*grams[1:]) if piece in token}
+        candidates = set()
+        for token in tokens:
+            candidates.update(self._token_postings.get(token, ()))
+        metrics.count(len(candidates))
+        return candidates
+
+    def _close_titles(self, word, n, cutoff):
+        """Same result as difflib.get_close_matches(word, titles, n, cutoff) over all titles.
+
+        The titles sharing the most trigrams with word are scored first; the
+        n-th best of them is a floor that lets the full scan (see FuzzyMatcher)
+        skip most titles on their cheap bounds.
+        """
+        shared = Counter()
+        for gram in title_trigrams(word):
+            shared.update(self._title_grams.get(gram, {}).keys())
+        shortlist = {}
+        for title, _ in shared.most_common(TITLE_SHORTLIST):
+            if count := self._titles_by_length.get(len(title), {}).get(title, 0):
+                shortlist.setdefault(len(title), {})[title] = count
+        seed = best_matches(word, shortlist, n, cutoff)
+        floor = seed[0][0] if len(seed) == n else 0.0
+        return self.fuzzy.close_matches(word, self._titles_by_length, self._catalog_lock, n, cutoff, floor)
+
+    @instrumented("search_book")
+    @cached("search_book", lambda query: normalize_key(query), depends=("books",))
     def search_book(self, query):
         q = str(query).strip().lower()
-        results = []
-        for book in self.books:
-            if (q in book.title.lower() or q in book.author.lower()
-                or q in book.isbn.lower() or q in book.genre.lower()):
-                results.append(book)
+        if not q:
+            metrics.count(len(self.books))
+            return list(self.books) or None
+        results = [book for book in self._substring_candidates(q)
+                   if (q in book.title.lower() or q in book.author.lower()
+                       or q in book.isbn.lower() or q in book.genre.lower())]
+        book_seq = self._book_seq
+        results.sort(key=lambda book: book_seq.get(book, -1))
 
         if not results:
-            titles = [book.title for book in self.books]
-            close_matches = difflib.get_close_matches(q, titles, n=5, cutoff=0.5)
-            for match in close_matches:
-                results.extend([b for b in self.books if b.title == match])
+            for match in self._close_titles(q, n=5, cutoff=0.5):
+                results.extend([b for b in list(self._books_by_title.get(normalize_key(match), [])) if b.title == match])
 
         return results if results else None
 
+    @instrumented("search_member")
+    @cached("search_member", lambda query: normalize_key(query), depends=("members",))
     def search_member(self, query):
         q = query.strip().lower()
+        metrics.count(len(self.members))
         results = [m for m in self.members if q in m.name.lower() or q in m.email.lower()]
 
         if not results:
@@ -238,120 +1859,349 @@ class Library:
  
     def _add_member(self, user):
       
-        if self.search_member(user.email) is not None:
-            print("Member with this email already exists.")
-            return
-        self.members.append(user)
+        with self._catalog_lock:
+            if self.get_member_by_email(user.email) is not None:
+                print("Member with this email already exists.")
+                return
+            self.members.append(user)
+            self._members_by_email[normalize_key(user.email)] = user
+            self._removed_members.pop(normalize_key(user.email), None)
+            self._bump("members")
+            self._record(("member", user))
+
+    def _add_members(self, members):
+        """Add a batch of members under one catalog lock and one storage write."""
+        with self._catalog_lock:
+            added = []
+            for member in members:
+                if self.get_member_by_email(member.email) is None:
+                    self.members.append(member)
+                    self._members_by_email[normalize_key(member.email)] = member
+                    self._removed_members.pop(normalize_key(member.email), None)
+                    added.append(member)
+            self._bump("members")
+            self._record(*(("member", member) for member in added))
+        return added
 
     def _add_book(self, book):
 
-        if any(b.isbn == book.isbn for b in self.books):
-            print("A book with this ISBN already exists.")
-            return
-        self.books.append(book)
+        with self._catalog_lock:
+            if self.get_book_by_isbn(book.isbn) is not None:
+                print("A book with this ISBN already exists.")
+                return
+            self.books.append(book)
+            self._index_book(book)
+            self._removed_books.pop(normalize_key(book.isbn), None)
+            self._record(("book", book))
 
     def _remove_member(self, user):
-        if user in self.members:
-            self.members.remove(user)
+        with self._catalog_lock:
+            self.end_sessions(user)
+            if self._detach_member(user):
+                cancelled = [book for book in list(user.reserved_books) if self.cancel_reservation(user, book)]
+                self._record(("remove_member", user), *(("book", book) for book in cancelled))
 
     def _remove_book(self, book):
-        if book in self.books:
-            self.books.remove(book)
+        with self._catalog_lock:
+            if self._detach_book(book):
+                self._record(("remove_book", book))
 
-    def _add_transaction(self, transaction):
-        self.transactions.append(transaction)
-        print(f"Transaction added: {transaction}")
+    def _detach_member(self, user):
+        if self._members_by_email.get(normalize_key(user.email)) is not user:
+            return False
+        self.members.remove(user)
+        del self._members_by_email[normalize_key(user.email)]
+        self._bump("members")
+        self._removed_members[normalize_key(user.email)] = user
+        return True
 
-    def _view_transactions(self):
-        table = [[t.member.name, t.book.title, t.book.isbn, t.borrow_date, t.return_date, t.due_date] for t in self.transactions]
-        print(tabulate(table, headers=["Member", "Title", "ISBN", "Borrow Date", "Return Date", "Due Date"]))
+    def _detach_book(self, book):
+        if self._books_by_isbn.get(normalize_key(book.isbn)) is not book:
+            return False
+        self.books.remove(book)
+        self._unindex_book(book)
+        self._removed_books[normalize_key(book.isbn)] = book
+        return True
+
+    def _store_transaction(self, transaction):
+        """Assign an id, append to the history and index; returns the stored transaction."""
+        with self._history_lock:
+            if transaction.id is None:
+                transaction.id = self._next_transaction_id
+            self._next_transaction_id = max(self._next_transaction_id, transaction.id + 1)
+            if self.compact:
+                transaction = self.transactions.append(transaction)
+            else:
+                self.transactions.append(transaction)
+                self._transactions_by_id[transaction.id] = transaction
+            if transaction.return_date is None:
+                self._open_loan(transaction)
+            self._update_fine_columns(transaction)
+            self._recommender.record_borrow(transaction.member, transaction.book)
+            self._versions["loans"] += 1
+        return transaction
 
-    def _view_books(self):
-        self.print_books()
+    def _add_transaction(self, transaction):
+        transaction = self._store_transaction(transaction)
+        print(f"Transaction added: {transaction}")
+        return transaction
+
+    def _view_transactions(self, offset=0, limit=PAGE_SIZE, sort=None, reverse=False, stream=False,
+                           since=None, until=None, member=None):
+        """Print a page of history, optionally limited to borrow dates in [since, until] and one member."""
+        self.load_history(None if member is None else [member])
+        history = self.transactions
+        start = 0
+        if since is None and until is None and member is None and sort is None:
+            # plain history order: jump straight to the page instead of skipping rows
+            start, offset = offset, 0
+        items = (history[row] for row in range(start, len(history)))
+        if since is not None or until is not None or member is not None:
+            items = (t for t in items
+                     if (since is None or t.borrow_date >= since) and (until is None or t.borrow_date <= until)
+                     and (member is None or t.member is member))
+        next_offset = self._show_page(
+            ["Member", "Title", "ISBN", "Borrow Date", "Return Date", "Due Date"], items,
+            lambda t: [t.member.name, t.book.title, t.book.isbn, t.borrow_date, t.return_date, t.due_date],
+            offset, limit, self.TRANSACTION_SORT_KEYS[sort] if sort else None, reverse, stream)
+        return start + next_offset if next_offset is not None else None
+
+    def _view_books(self, **options):
+        return self.print_books(**options)
+
+    def _add_books(self, books):
+        """Add a batch of books under one catalog lock and one storage write."""
+        with self._catalog_lock:
+            added = []
+            for book in books:
+                if self.get_book_by_isbn(book.isbn) is None:
+                    self.books.append(book)
+                    self._index_book(book)
+                    self._removed_books.pop(normalize_key(book.isbn), None)
+                    added.append(book)
+            self._record(*(("book", book) for book in added))
+        return added
+
+    def import_books(self, records, batch_size=IMPORT_BATCH):
+        """Add books from an iterable of dicts (see read_records).
+
+        Rows without an ISBN, title or author, with a bad copy count, or whose
+        ISBN is already in the catalog are rejected. Returns (imported, rejects)
+        where rejects is a list of (row number, reason).
+        """
+        imported, rejects, batch, pending = 0, [], [], set()
+        for row, record in enumerate(records, 1):
+            if not isinstance(record, dict):
+                rejects.append((row, "not a record"))
+                continue
+            isbn, title, author = (str(record.get(f) or "").strip() for f in ("isbn", "title", "author"))
+            if not (isbn and title and author):
+                rejects.append((row, "missing isbn, title or author"))
+                continue
+            total_copies = copy_count(record.get("total_copies"))
+            if total_copies is None:
+                rejects.append((row, f"bad total_copies {record.get('total_copies')!r}"))
+                continue
+            key = normalize_key(isbn)
+            if key in pending or self.get_book_by_isbn(isbn) is not None:
+                rejects.append((row, f"duplicate ISBN {isbn}"))
+                continue
+            pending.add(key)
+            batch.append(Book(title, author, isbn, str(record.get("genre") or "").strip(),
+                              record.get("description") or None, total_copies=total_copies))
+            if len(batch) >= batch_size:
+                imported += len(self._add_books(batch))
+                batch, pending = [], set()
+                print(f"Imported {imported} books, rejected {len(rejects)} rows...")
+        if batch:
+            imported += len(self._add_books(batch))
+        print(f"Imported {imported} books, rejected {len(rejects)} rows.")
+        return imported, rejects
+
+    def export_records(self, kind):
+        """Yield book, member or transaction records one at a time; passwords are left out."""
+        if kind == "books":
+            for book in list(self.books):
+                record = book_record(book)
+                del record["removed"]
+                yield record
+        elif kind == "members":
+            for member in list(self.members):
+                record = member_record(member)
+                del record["password"], record["removed"]
+                yield record
+        elif kind == "transactions":
+            self.load_history()
+            # indexed reads so the compact store never builds views for the whole history
+            for row in range(len(self.transactions)):
+                yield transaction_record(self.transactions[row])
+        else:
+            raise ValueError(f"Unknown export '{kind}'; use books, members or transactions.")
 
+    @instrumented("save_library", lambda self: len(self.books) + len(self.members) + len(self.transactions))
     def save_library(self):
         try:
-            with open('library.pkl', 'wb') as file:
-                pickle.dump(self, file)
+            self.storage.save(self)
             print("Library saved.")
         except Exception as e:
             print("Error saving library:", e)
 
+    @instrumented("retrieve_library", lambda self: len(self.books) + len(self.members) + len(self.transactions))
     def retrieve_library(self):
         try:
-            with open('library.pkl', 'rb') as file:
-                loaded_library = pickle.load(file)
-                self.members = loaded_library.members
-                self.books = loaded_library.books
-                self.transactions = loaded_library.transactions
-                print("Library restored from file.")
+            self.storage.load(self)
         except FileNotFoundError:
             print("No saved library found.")
         except Exception as e:
             print("Error loading library:", e)
 
-    
-    def borrow_book(self, member, title_or_isbn):
-        if len(member.borrowed_books) >= BORROW_LIMIT:
-            print(f"Borrowing limit reached. You can borrow up to {BORROW_LIMIT} books.")
-            return
-        books = self.search_book(title_or_isbn)
-        if not books:
-            print(f"No book found with title or ISBN '{title_or_isbn}'.")
-            return
-        book = books[0]  # take first match
-        if not book.is_available():
-            print(f"'{book.title}' is currently not available. ({book.available_copies}/{book.total_copies} copies left)")
-            reserve_choice = input("Would you like to reserve it? (y/n): ").lower()
-            if reserve_choice == "y":
-                book.reserve_book(member)
+    def reserve_book(self, member, book, tier=0):
+        """Queue a hold; lower tiers are served before higher ones."""
+        with self._circulation_lock(member, book):
+            if book.reserve_book(member, tier):
                 member.reserved_books.append(book)
+                self._record(("book", book), ("member", member),
+                             ("outbox", self.outbox.put(member.email, member.notifications[-1])))
+                return True
+        return False
+
+    def cancel_reservation(self, member, book):
+        with self._circulation_lock(member, book):
+            if book.cancel_reservation(member):
+                self._record(("book", book), ("member", member))
+                return True
+        return False
+
+    def view_notifications(self, member):
+        with self._circulation_lock(member):
+            member.view_notifications()
+            self._record(("member", member))
+
+    def view_pending_dues(self, member):
+        today = self.today()
+        balance = self._ledger.balances.get(member, 0.0)
+        overdue = [(t, t.calculate_fine(today) - self._ledger.prepaid.get(t.id, 0.0)) for t in self.open_loans(member)]
+        overdue = [(t, fine) for t, fine in overdue if fine > 0]
+        if balance <= 0 and not overdue:
+            print("You have no pending dues.")
             return
+        print("Pending dues:")
+        if balance > 0:
+            print(f"Unpaid fines on returned books: ${balance:.2f}")
+        for t, fine in overdue:
+            print(f"Book: {t.book.title}, Due Date: {t.due_date}, Fine so far: ${fine:.2f}")
+
+    def clear_dues(self, member):
+        """Pay the member's outstanding fines; overdue loans stay open and keep accruing."""
+        with self._circulation_lock(member):
+            entries = []
+            if (balance := self._ledger.balances.get(member, 0.0)) > 0:
+                entries.append(self._ledger_entry(member, "payment", balance))
+                print(f"Fine of Rs.{balance} paid successfully for returned books.")
+            # a payment on an open loan is netted against the fine charged when it is returned
+            for t in self.open_loans(member):
+                if (due := t.calculate_fine(self.today()) - self._ledger.prepaid.get(t.id, 0.0)) > 0:
+                    entries.append(self._ledger_entry(member, "payment", due, t))
+                    print(f"Fine of Rs.{due} paid successfully for '{t.book.title}'.")
+            if not entries:
+                print("No pending dues.")
+            self._record(*(("ledger", entry) for entry in entries))
 
+    
+    @instrumented("borrow_book")
+    def borrow_book(self, member, title_or_isbn, reserve=None):
+        """Issue a copy and return the transaction, or None.
+
+        When no copy is free the member is offered a reservation; `reserve`
+        answers that question instead of prompting.
+        """
+        with self._circulation_lock(member):
+            if len(member.borrowed_books) >= BORROW_LIMIT:
+                print(f"Borrowing limit reached. You can borrow up to {BORROW_LIMIT} books.")
+                return None
+            book = self._find_book(title_or_isbn)
+            if not book:
+                print(f"No book found with title or ISBN '{title_or_isbn}'.")
+                return None
+            with self._circulation_lock(member, book):
+                if book.is_available(member):
+                    return self._issue(member, book)
+                held = f", {len(book.holds)} on hold" if book.holds else ""
+                print(f"'{book.title}' is currently not available. "
+                      f"({book.available_copies}/{book.total_copies} copies left{held})")
+        if reserve is None:
+            reserve = input("Would you like to reserve it? (y/n): ").lower() == "y"
+        if reserve:
+            self.reserve_book(member, book)
+        return None
+
+    def _issue(self, member, book):
+        # called with the member and book locks held
+        today = self.today()
     # Check if member has outstanding fines
-        for t in member.transactions:
-            if t.return_date is None and t.calculate_fine(date.today()) > 0:
-                fine = t.calculate_fine(date.today())
-                print(f"Cannot borrow. Outstanding fine: Rs.{fine} for '{t.book.title}'.")
-                return
+        if (fine := self.outstanding_fine(member, today)) > 0:
+            print(f"Cannot borrow. Outstanding fine: Rs.{fine}.")
+            return None
 
     # Proceed to borrow
-        if book.borrow_copy():
-            transaction = Transaction(member, book, date.today())
-            self._add_transaction(transaction)
-            member.add_borrowed_book(book)
-            member.add_transaction(transaction)
+        if book.borrow_copy(member):
+            with self._history_lock:
+                self.scheduler.cancel("hold", (normalize_key(book.isbn), normalize_key(member.email)))
+                # record under the lock that hands out the id, so storage sees ids in order
+                transaction = self._add_transaction(Transaction(member, book, today))
+                member.add_borrowed_book(book)
+                member.add_transaction(transaction)
+                self._record(("transaction", transaction), ("book", book), ("member", member))
             print(f"{member.name} borrowed '{book.title}'. Due on {transaction.due_date}.")
-        else:
-            print(f"No available copies for '{book.title}'.")
+            return transaction
+        print(f"No available copies for '{book.title}'.")
+        return None
 
 
+    @instrumented("return_book")
     def return_book(self, member, title_or_isbn):
-        books = self.search_book(title_or_isbn)
-        if not books:
+        """Close the member's open loan of the book and return the fine, or None."""
+        # by ISBN, books no longer in the catalog can still come back
+        book = (self.get_book_by_isbn(title_or_isbn) or self._removed_books.get(normalize_key(title_or_isbn))
+                or self._find_book(title_or_isbn))
+        if not book:
             print(f"No book found with title or ISBN '{title_or_isbn}'.")
-            return
-
-        book = books[0]
-        transaction = next((t for t in self.transactions if t.member == member and t.book == book and t.return_date is None), None)
-
-        if not transaction:
-            print("No matching transaction found for this member and book.")
-            return
+            return None
 
-        today = date.today()
-        transaction.return_date = today
-        fine = transaction.calculate_fine(today)
+        with self._circulation_lock(member, book):
+            loans = self._open_loans.get((member, book))
 
-        if fine > 0:
-            print(f"Returned late! Fine = Rs.{fine}")
-        else:
-            print("Book returned on time. No fine.")
+            if not loans:
+                print("No matching transaction found for this member and book.")
+                return None
 
-        book.return_copy()
-        member.remove_borrowed_book(book)
-        book.notify_next_reserver()
+            transaction = loans[0]
+            today = self.today()
+            transaction.return_date = today
+            self._close_loan(transaction)
+            self._update_fine_columns(transaction)
+            fine = transaction.calculate_fine(today)
 
+            changes = [("transaction", transaction), ("book", book), ("member", member)]
+            if fine > 0:
+                # frozen now, less anything paid while the loan was still open
+                unpaid = fine - self._ledger.prepaid.get(transaction.id, 0.0)
+                changes.append(("ledger", self._ledger_entry(member, "fine", unpaid, transaction)))
+                print(f"Returned late! Fine = Rs.{fine}")
+            else:
+                print("Book returned on time. No fine.")
+
+            book.return_copy()
+            member.remove_borrowed_book(book)
+            changes += self._offer_hold(book, today)
+            self._record(*changes)
+            return fine
+
+    @instrumented("recommend_books")
+    @cached("recommend_books",
+            lambda member=None, mode="generic", query_title=None, n=3:
+                (mode, normalize_key(member.email) if member and mode == "personalized" else None, query_title, n),
+            depends=("books", "loans"))
     def recommend_books(self, member=None,mode="generic", query_title=None, n=3):
         if not self.books:
             return []
@@ -359,17 +2209,11 @@ class Library:
         if mode == "generic":
             if not query_title:
                 return []
-            titles = [book.title for book in self.books]
-            close_matches = difflib.get_close_matches(query_title, titles, n=n, cutoff=0.3)
-            return close_matches
+            return self._close_titles(query_title, n=n, cutoff=0.3)
         elif mode == "personalized" and member:
-            if not member.borrowed_books:
-                return []
-            genres = [book.genre for book in member.borrowed_books if book.genre]
-            fav_genre = Counter(genres).most_common(1)[0][0]
-
-            recs = [book.title for book in self.books if book.genre == fav_genre and book not in member.borrowed_books]
-            return recs[:3]
+            with self._history_lock:
+                recs = self._recommender.recommend(member, n, exclude=member.borrowed_books)
+            return [book.title for book in recs]
         return []
     
     
@@ -377,6 +2221,8 @@ class Library:
     
 
 class Librarian(User):
+    __slots__ = ("library",)
+
     def __init__(self, name, age, email, password, library):
         super().__init__(name, age, email, password)
         self.library = library
@@ -394,6 +2240,38 @@ class Librarian(User):
         print(f"Member '{name}' registered successfully.")
         return member
 
+    def register_members_bulk(self, records, workers=None, processes=True, chunk_size=10_000):
+        """Register members from dicts with name, age, email and password.
+
+        Credentials are checked and hashed on a process pool (or a thread pool
+        with processes=False), emails are deduplicated case-insensitively against
+        the library and the rest of the input, and each chunk of accepted
+        members is inserted as one batch. Returns one report dict per record:
+        {"row", "email", "accepted", "reason"}.
+        """
+        report = []
+        pool = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=workers)
+        seen = set()
+        rows = iter(records)
+        with pool:
+            while chunk := list(islice(rows, chunk_size)):
+                checked = pool.map(check_member_record, chunk, chunksize=max(1, len(chunk) // 64))
+                accepted = []
+                for record, (problem, password_hash) in zip(chunk, checked):
+                    email = str(record.get("email") or "").strip() if isinstance(record, dict) else ""
+                    key = normalize_key(email)
+                    if problem is None and (key in seen or self.library.get_member_by_email(email)):
+                        problem = "duplicate email"
+                    if problem is None:
+                        seen.add(key)
+                        accepted.append(Member(str(record["name"]).strip(), int(record["age"]), email,
+                                               password_hash, hashed=True))
+                    report.append({"row": len(report) + 1, "email": email,
+                                   "accepted": problem is None, "reason": problem})
+                self.library._add_members(accepted)
+        print(f"Registered {sum(r['accepted'] for r in report)} of {len(report)} members.")
+        return report
+
     def add_book(self, book):
         self.library._add_book(book)
 
@@ -405,16 +2283,22 @@ class Librarian(User):
 
 
 class Transaction:
+    __slots__ = ("member", "book", "borrow_date", "return_date", "due_date", "id")
+
     def __init__(self, member, book, borrow_date, return_date=None):
         self.member = member
         self.book = book
         self.borrow_date = borrow_date
         self.return_date = return_date 
         self.due_date = borrow_date + timedelta(days=14)
+        self.id = None
    
         if self.return_date is None:
             self.book.borrowed = True
 
+    def __setstate__(self, state):
+        restore_state(self, state, id=None)
+
     def __str__(self):
         return f"Transaction(member={self.member.name}, book={self.book.title}, borrow_date={self.borrow_date}, return_date={self.return_date})"
 
@@ -422,13 +2306,843 @@ class Transaction:
  
         if self.return_date and self.return_date > self.due_date:
             days_overdue = (self.return_date - self.due_date).days
-            return days_overdue * 0.5
+            return days_overdue * FINE_PER_DAY
         elif not self.return_date and current_date > self.due_date:
             days_overdue = (current_date - self.due_date).days
-            return days_overdue * 0.5
+            return days_overdue * FINE_PER_DAY
         return 0
 
 
+class FineColumns:
+    """Due and return dates of every transaction as datetime64 columns indexed by transaction id."""
+
+    def __init__(self):
+        self.due = np.full(0, np.datetime64("NaT"), dtype="datetime64[D]")
+        self.returned = self.due.copy()
+
+    def update(self, transaction):
+        if transaction.id >= len(self.due):
+            size = max(transaction.id + 1, 2 * len(self.due), 1024)
+            for name in ("due", "returned"):
+                column = np.full(size, np.datetime64("NaT"), dtype="datetime64[D]")
+                column[:len(getattr(self, name))] = getattr(self, name)
+                setattr(self, name, column)
+        self.due[transaction.id] = transaction.due_date
+        self.returned[transaction.id] = transaction.return_date or np.datetime64("NaT")
+
+    def fines(self, as_of, ids=None):
+        if ids is None:
+            ids = np.flatnonzero(~np.isnat(self.due))
+        due = self.due[ids]
+        returned = self.returned[ids]
+        # returned loans are fined up to the return date, open ones up to as_of
+        end = np.where(np.isnat(returned), np.datetime64(as_of, "D"), returned)
+        days_overdue = (end - due).astype(np.int64)
+        return ids, np.where(days_overdue > 0, days_overdue * FINE_PER_DAY, 0.0)
+
+
+class LedgerEntry:
+    """One fine charged at return time, or one payment (against an open loan when transaction_id is set)."""
+    __slots__ = ("id", "member", "kind", "amount", "date", "transaction_id")
+
+    def __init__(self, entry_id, member, kind, amount, day, transaction_id=None):
+        self.id = entry_id
+        self.member = member
+        self.kind = kind
+        self.amount = amount
+        self.date = day
+        self.transaction_id = transaction_id
+
+
+class FineLedger:
+    """Fine and payment entries with running per-member balances, plus open loans ordered by due date.
+
+    A member owes their balance (fines frozen when late books came back,
+    minus payments) plus whatever their open loans have accrued beyond
+    prepaid amounts, so nothing needs the member's closed history.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.ids = set()
+        self.next_id = 0
+        self.balances = {}  # member -> unpaid fines on returned loans
+        self.prepaid = {}   # open transaction id -> paid before the book came back
+        self._due_dates = []  # distinct due dates of open loans, ascending
+        self._open_by_due = {}
+
+    def apply(self, entry):
+        self.entries.append(entry)
+        self.ids.add(entry.id)
+        self.next_id = max(self.next_id, entry.id + 1)
+        if entry.kind == "fine":
+            self.balances[entry.member] = self.balances.get(entry.member, 0.0) + entry.amount
+            self.prepaid.pop(entry.transaction_id, None)
+        elif entry.transaction_id is None:
+            self.balances[entry.member] = self.balances.get(entry.member, 0.0) - entry.amount
+        else:
+            self.prepaid[entry.transaction_id] = self.prepaid.get(entry.transaction_id, 0.0) + entry.amount
+
+    def open(self, transaction):
+        due = transaction.due_date
+        if due not in self._open_by_due:
+            self._open_by_due[due] = {}
+            bisect.insort(self._due_dates, due)
+        self._open_by_due[due][transaction] = None
+
+    def close(self, transaction):
+        due = transaction.due_date
+        loans = self._open_by_due.get(due)
+        if loans is not None and loans.pop(transaction, False) is None and not loans:
+            del self._open_by_due[due]
+            del self._due_dates[bisect.bisect_left(self._due_dates, due)]
+
+    def clear_open(self):
+        self._due_dates = []
+        self._open_by_due = {}
+
+    def overdue(self, as_of):
+        """Open loans due before as_of, earliest due date first."""
+        for due in self._due_dates:
+            if due >= as_of:
+                return
+            yield from self._open_by_due[due]
+
+
+class CompactTransaction:
+    """Transaction view over one row of a TransactionStore."""
+
+    __slots__ = ("_store", "id")
+
+    def __init__(self, store, row):
+        self._store = store
+        self.id = row
+
+    @property
+    def member(self):
+        return self._store.members[self._store.member_ids[self.id]]
+
+    @property
+    def book(self):
+        return self._store.books[self._store.book_ids[self.id]]
+
+    @property
+    def borrow_date(self):
+        return date.fromordinal(self._store.borrowed[self.id])
+
+    @property
+    def due_date(self):
+        return date.fromordinal(self._store.due[self.id])
+
+    @property
+    def return_date(self):
+        returned = self._store.returned[self.id]
+        return date.fromordinal(returned) if returned else None
+
+    @return_date.setter
+    def return_date(self, value):
+        self._store.returned[self.id] = value.toordinal() if value else 0
+
+    def __eq__(self, other):
+        return isinstance(other, CompactTransaction) and other._store is self._store and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    __str__ = Transaction.__str__
+    calculate_fine = Transaction.calculate_fine
+
+
+class TransactionStore:
+    """Array-backed transaction history used by Library(compact=True).
+
+    Row i is transaction id i: member and book ids plus borrow, due and
+    return date ordinals (0 = not returned). Indexing yields
+    CompactTransaction views, and the columns double as the FineColumns
+    used by compute_fines.
+    """
+
+    def __init__(self):
+        self.members = []
+        self.books = []
+        self._member_index = {}
+        self._book_index = {}
+        self.member_ids = array("q")
+        self.book_ids = array("q")
+        self.borrowed = array("q")
+        self.due = array("q")
+        self.returned = array("q")
+
+    def _intern(self, obj, objects, index):
+        if obj not in index:
+            index[obj] = len(objects)
+            objects.append(obj)
+        return index[obj]
+
+    def append(self, transaction):
+        if transaction.id != len(self.due):
+            raise ValueError(f"transaction id {transaction.id} is not the next row ({len(self.due)})")
+        self.member_ids.append(self._intern(transaction.member, self.members, self._member_index))
+        self.book_ids.append(self._intern(transaction.book, self.books, self._book_index))
+        self.borrowed.append(transaction.borrow_date.toordinal())
+        self.due.append(transaction.due_date.toordinal())
+        self.returned.append(transaction.return_date.toordinal() if transaction.return_date else 0)
+        return CompactTransaction(self, transaction.id)
+
+    def get(self, transaction_id, default=None):
+        if 0 <= transaction_id < len(self.due):
+            return CompactTransaction(self, transaction_id)
+        return default
+
+    def __len__(self):
+        return len(self.due)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self.due)
+        if not 0 <= row < len(self.due):
+            raise IndexError("transaction index out of range")
+        return CompactTransaction(self, row)
+
+    def __iter__(self):
+        return (CompactTransaction(self, row) for row in range(len(self.due)))
+
+    def update(self, transaction):
+        pass  # views write straight into the columns
+
+    def fines(self, as_of, ids=None):
+        due = np.array(self.due, dtype=np.int64)
+        returned = np.array(self.returned, dtype=np.int64)
+        if ids is None:
+            ids = np.arange(len(due))
+        due, returned = due[ids], returned[ids]
+        days_overdue = np.where(returned == 0, as_of.toordinal(), returned) - due
+        return ids, np.where(days_overdue > 0, days_overdue * FINE_PER_DAY, 0.0)
+
+
+class TransactionRows:
+    """One member's transactions in a TransactionStore, kept as row ids; views are made on access."""
+
+    __slots__ = ("_store", "rows")
+
+    def __init__(self, store, rows=()):
+        self._store = store
+        self.rows = array("q", rows)
+
+    def append(self, transaction):
+        self.rows.append(transaction.id)
+
+    def sort(self, key=None, reverse=False):
+        self.rows = array("q", (t.id for t in sorted(self, key=key, reverse=reverse)))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [CompactTransaction(self._store, row) for row in self.rows[i]]
+        return CompactTransaction(self._store, self.rows[i])
+
+    def __iter__(self):
+        return (CompactTransaction(self._store, row) for row in self.rows)
+
+
+def book_record(book):
+    return {"isbn": book.isbn, "title": book.title, "author": book.author, "genre": book.genre,
+            "description": book.description, "total_copies": book.total_copies,
+            "available_copies": book.available_copies,
+            "reservations": [[m.email, tier] for m, tier in book.reservation_queue.entries()],
+            "holds": [[m.email, until.isoformat()] for m, until in book.holds.items()], "removed": False}
+
+def member_record(member):
+    return {"email": member.email, "name": member.name, "age": member.age, "password": member.password,
+            "borrowed": [b.isbn for b in member.borrowed_books],
+            "reserved": [b.isbn for b in member.reserved_books],
+            "notifications": list(member.notifications), "removed": False}
+
+def transaction_record(transaction):
+    return {"id": transaction.id, "email": transaction.member.email, "isbn": transaction.book.isbn,
+            "borrow_date": transaction.borrow_date.isoformat(),
+            "return_date": transaction.return_date.isoformat() if transaction.return_date else None}
+
+def ledger_record(entry):
+    return {"id": entry.id, "email": entry.member.email, "kind": entry.kind, "amount": entry.amount,
+            "date": entry.date.isoformat(), "transaction": entry.transaction_id}
+
+def outbox_record(event):
+    return {"id": event.id, "email": event.email, "message": event.message,
+            "created": event.created.isoformat(), "status": event.status, "attempts": event.attempts}
+
+RECORDS = {
+    "book": book_record,
+    "member": member_record,
+    "transaction": transaction_record,
+    "ledger": ledger_record,
+    "outbox": outbox_record,
+    "remove_book": lambda book: book.isbn,
+    "remove_member": lambda member: member.email,
+}
+
+
+class PickleStorage:
+    """Whole-library pickle written on save; individual changes are not persisted."""
+
+    def __init__(self, path="library.pkl"):
+        self.path = path
+
+    def write(self, changes):
+        pass
+
+    def save(self, library):
+        with open(self.path, 'wb') as file:
+            pickle.dump(library, file)
+
+    def load(self, library):
+        self.restore(library)
+        print("Library restored from file.")
+
+    def restore(self, library):
+        """load() without the message, for callers off the main thread."""
+        with open(self.path, 'rb') as file:
+            loaded_library = pickle.load(file)
+        library.members = loaded_library.members
+        library.books = loaded_library.books
+        library.transactions = loaded_library.transactions
+        # pickles from before the ledger start with an empty one
+        library._ledger = getattr(loaded_library, "_ledger", None)
+        if hasattr(loaded_library, "outbox"):
+            for event in loaded_library.outbox.pending.values():
+                library.outbox.apply(event)
+        library._rebuild_indexes()
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """SQLite store; every Library mutation is written as one small transaction."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            key TEXT PRIMARY KEY, isbn TEXT, title TEXT, author TEXT, genre TEXT, description TEXT,
+            total_copies INTEGER, available_copies INTEGER, removed INTEGER DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS members (
+            key TEXT PRIMARY KEY, email TEXT, name TEXT, age INTEGER, password TEXT,
+            borrowed TEXT, reserved TEXT, removed INTEGER DEFAULT 0);
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY, member_key TEXT, book_key TEXT, borrow_date TEXT, return_date TEXT);
+        CREATE TABLE IF NOT EXISTS reservations (
+            book_key TEXT, position INTEGER, member_key TEXT, tier INTEGER DEFAULT 0,
+            PRIMARY KEY (book_key, position));
+        CREATE TABLE IF NOT EXISTS holds (
+            book_key TEXT, member_key TEXT, until TEXT, PRIMARY KEY (book_key, member_key));
+        CREATE TABLE IF NOT EXISTS notifications (
+            member_key TEXT, position INTEGER, message TEXT, PRIMARY KEY (member_key, position));
+        CREATE TABLE IF NOT EXISTS ledger (
+            id INTEGER PRIMARY KEY, member_key TEXT, kind TEXT, amount REAL, date TEXT, transaction_id INTEGER);
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY, email TEXT, message TEXT, created TEXT, status TEXT, attempts INTEGER);
+        CREATE INDEX IF NOT EXISTS outbox_pending ON outbox (id) WHERE status = 'pending';
+        CREATE INDEX IF NOT EXISTS transactions_member ON transactions (member_key);
+        CREATE INDEX IF NOT EXISTS transactions_open ON transactions (id) WHERE return_date IS NULL;
+    """
+
+    def __init__(self, path="library.db", lazy_history=False):
+        self.path = path
+        # load open loans only at startup; Library.load_history reads the rest on demand
+        self.lazy_history = lazy_history
+        self._conn = None
+        self._lock = threading.Lock()
+
+    @property
+    def conn(self):
+        # opened on first use so constructing a Library stays cheap
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            # databases from before the ledger get an empty one: their returned loans count as settled
+            self._conn.executescript(self.SCHEMA)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(reservations)")}
+            if "tier" not in columns:
+                self._conn.execute("ALTER TABLE reservations ADD COLUMN tier INTEGER DEFAULT 0")
+        return self._conn
+
+    def write(self, changes):
+        records = [(kind, RECORDS[kind](obj)) for kind, obj in changes]
+        with self._lock, self.conn as conn:
+            for kind, record in records:
+                self._write_record(conn, kind, record)
+
+    def _write_record(self, conn, kind, record):
+        if kind == "book":
+            key = normalize_key(record["isbn"])
+            # upsert in place: load() lists books in rowid order, which REPLACE would change
+            conn.execute("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0) ON CONFLICT(key) DO UPDATE SET "
+                         "isbn = excluded.isbn, title = excluded.title, author = excluded.author, "
+                         "genre = excluded.genre, description = excluded.description, "
+                         "total_copies = excluded.total_copies, available_copies = excluded.available_copies, "
+                         "removed = 0",
+                         (key, record["isbn"], record["title"], record["author"], record["genre"],
+                          record["description"], record["total_copies"], record["available_copies"]))
+            conn.execute("DELETE FROM reservations WHERE book_key = ?", (key,))
+            conn.executemany("INSERT INTO reservations VALUES (?, ?, ?, ?)",
+                             [(key, i, normalize_key(email), tier)
+                              for i, (email, tier) in enumerate(record["reservations"])])
+            conn.execute("DELETE FROM holds WHERE book_key = ?", (key,))
+            conn.executemany("INSERT INTO holds VALUES (?, ?, ?)",
+                             [(key, normalize_key(email), until) for email, until in record["holds"]])
+        elif kind == "member":
+            key = normalize_key(record["email"])
+            conn.execute("INSERT INTO members VALUES (?, ?, ?, ?, ?, ?, ?, 0) ON CONFLICT(key) DO UPDATE SET "
+                         "email = excluded.email, name = excluded.name, age = excluded.age, "
+                         "password = excluded.password, borrowed = excluded.borrowed, "
+                         "reserved = excluded.reserved, removed = 0",
+                         (key, record["email"], record["name"], record["age"], record["password"],
+                          json.dumps(record["borrowed"]), json.dumps(record["reserved"])))
+            conn.execute("DELETE FROM notifications WHERE member_key = ?", (key,))
+            conn.executemany("INSERT INTO notifications VALUES (?, ?, ?)",
+                             [(key, i, message) for i, message in enumerate(record["notifications"])])
+        elif kind == "transaction":
+            conn.execute("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?, ?, ?)",
+                         (record["id"], normalize_key(record["email"]), normalize_key(record["isbn"]),
+                          record["borrow_date"], record["return_date"]))
+        elif kind == "ledger":
+            conn.execute("INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?)",
+                         (record["id"], normalize_key(record["email"]), record["kind"], record["amount"],
+                          record["date"], record["transaction"]))
+        elif kind == "outbox":
+            conn.execute("INSERT OR REPLACE INTO outbox VALUES (?, ?, ?, ?, ?, ?)",
+                         (record["id"], record["email"], record["message"], record["created"], record["status"],
+                          record["attempts"]))
+        elif kind == "remove_book":
+            conn.execute("UPDATE books SET removed = 1 WHERE key = ?", (normalize_key(record),))
+        elif kind == "remove_member":
+            conn.execute("UPDATE members SET removed = 1 WHERE key = ?", (normalize_key(record),))
+
+    def save(self, library):
+        # every change is already committed by write()
+        self.conn.commit()
+
+    def write_all(self, library):
+        """Write the complete library (used when importing from another store)."""
+        changes = [("book", b) for b in library.books] + [("member", m) for m in library.members]
+        changes += [("book", b) for b in library._removed_books.values()]
+        changes += [("member", m) for m in library._removed_members.values()]
+        changes += [("transaction", t) for t in library.transactions]
+        changes += [("ledger", entry) for entry in library._ledger.entries]
+        changes += [("outbox", event) for event in library.outbox.pending.values()]
+        changes += [("remove_book", b) for b in library._removed_books.values()]
+        changes += [("remove_member", m) for m in library._removed_members.values()]
+        self.write(changes)
+
+    def load(self, library):
+        conn = self.conn
+        reservations = {}
+        for book_key, email, tier in conn.execute(
+                "SELECT r.book_key, m.email, r.tier FROM reservations r JOIN members m ON m.key = r.member_key "
+                "ORDER BY r.book_key, r.position"):
+            reservations.setdefault(book_key, []).append([email, tier])
+        holds = {}
+        for book_key, email, until in conn.execute(
+                "SELECT h.book_key, m.email, h.until FROM holds h JOIN members m ON m.key = h.member_key"):
+            holds.setdefault(book_key, []).append([email, until])
+        notifications = {}
+        for member_key, message in conn.execute(
+                "SELECT member_key, message FROM notifications ORDER BY member_key, position"):
+            notifications.setdefault(member_key, []).append(message)
+        books = [{"isbn": isbn, "title": title, "author": author, "genre": genre, "description": description,
+                  "total_copies": total, "available_copies": available,
+                  "reservations": reservations.get(key, []), "holds": holds.get(key, []),
+                  "removed": bool(removed)}
+                 for key, isbn, title, author, genre, description, total, available, removed
+                 in conn.execute("SELECT * FROM books ORDER BY rowid")]
+        members = [{"email": email, "name": name, "age": age, "password": password,
+                    "borrowed": json.loads(borrowed), "reserved": json.loads(reserved),
+                    "notifications": notifications.get(key, []), "removed": bool(removed)}
+                   for key, email, name, age, password, borrowed, reserved, removed
+                   in conn.execute("SELECT * FROM members ORDER BY rowid")]
+        # the compact store needs every row id, so it always loads the whole history
+        lazy = self.lazy_history and not library.compact
+        transactions = self._transaction_records(
+            "WHERE t.return_date IS NULL" if lazy else "")
+        ledger = [{"id": entry_id, "email": email, "kind": kind, "amount": amount, "date": day,
+                   "transaction": transaction_id}
+                  for entry_id, email, kind, amount, day, transaction_id in conn.execute(
+                      "SELECT l.id, m.email, l.kind, l.amount, l.date, l.transaction_id FROM ledger l "
+                      "JOIN members m ON m.key = l.member_key ORDER BY l.id")]
+        outbox = [{"id": event_id, "email": email, "message": message, "created": created, "status": status,
+                   "attempts": attempts}
+                  for event_id, email, message, created, status, attempts in conn.execute(
+                      "SELECT * FROM outbox WHERE status = 'pending' ORDER BY id")]
+        # ids must keep growing past delivered events too
+        last_event, = conn.execute("SELECT MAX(id) FROM outbox").fetchone()
+        library.outbox.next_id = max(library.outbox.next_id, (last_event or -1) + 1)
+        library._load_records(books, members, transactions, ledger, outbox)
+        if lazy:
+            last_id, = conn.execute("SELECT MAX(id) FROM transactions").fetchone()
+            library._next_transaction_id = max(library._next_transaction_id, (last_id or -1) + 1)
+            library._history_complete = False
+            library._history_members = set()
+        print("Library restored from database.")
+
+    def _transaction_records(self, where="", params=()):
+        return [{"id": tid, "email": email, "isbn": isbn, "borrow_date": borrowed, "return_date": returned}
+                for tid, email, isbn, borrowed, returned in self.conn.execute(
+                    "SELECT t.id, m.email, b.isbn, t.borrow_date, t.return_date FROM transactions t "
+                    "JOIN members m ON m.key = t.member_key JOIN books b ON b.key = t.book_key "
+                    f"{where} ORDER BY t.id", params)]
+
+    def load_history(self, emails=None):
+        """Closed transaction records, for the members with these emails or for everyone."""
+        if emails is None:
+            return self._transaction_records("WHERE t.return_date IS NOT NULL")
+        keys = [normalize_key(email) for email in emails]
+        records = []
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            records += self._transaction_records(
+                f"WHERE t.return_date IS NOT NULL AND t.member_key IN ({', '.join('?' * len(chunk))})", chunk)
+        return records
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class JournalStorage:
+    """Pickle snapshot plus an append-only journal of changes since that snapshot.
+
+    Each write() appends one JSON line. fsync_every=N forces the journal to
+    disk every N records (None only flushes to the OS). Once the journal
+    grows past compact_bytes it is rotated, and a background thread replays
+    it onto the previous snapshot to write the next one; the live library is
+    never pickled mid-write. load() replays the rotated journal, if a crash
+    left one behind, and then the live journal on top of the snapshot.
+    """
+
+    def __init__(self, snapshot_path="library.pkl", journal_path="library.journal",
+                 fsync_every=None, compact_bytes=4 * 1024 * 1024):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path
+        self.fsync_every = fsync_every
+        self.compact_bytes = compact_bytes
+        self._library = None
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._compaction = None
+
+    @property
+    def _rotated_path(self):
+        return self.journal_path + ".old"
+
+    def _open_journal(self):
+        self._file = open(self.journal_path, "a", encoding="utf-8")
+
+    def write(self, changes):
+        line = json.dumps([[kind, RECORDS[kind](obj)] for kind, obj in changes], separators=(",", ":"))
+        with self._lock:
+            if self._file is None:
+                self._open_journal()
+            self._file.write(line + "\n")
+            self._file.flush()
+            self._unsynced += 1
+            if self.fsync_every and self._unsynced >= self.fsync_every:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+            if self._file.tell() >= self.compact_bytes:
+                self._start_compaction()
+
+    def _start_compaction(self):
+        # called with self._lock held: only rotate here; the compaction thread
+        # rebuilds the snapshot from files and never touches the live library
+        if self._compaction and self._compaction.is_alive():
+            return
+        if not os.path.exists(self._rotated_path):
+            self._file.close()
+            os.replace(self.journal_path, self._rotated_path)
+            self._open_journal()
+            self._unsynced = 0
+        # else a crash left a rotated journal behind: fold that one first
+        self._compaction = threading.Thread(target=self._fold_journal, daemon=True)
+        self._compaction.start()
+
+    def _fold_journal(self):
+        """Replay the rotated journal onto the last snapshot and write the result as the new snapshot."""
+        library = Library(compact=getattr(self._library, "compact", False))
+        if os.path.exists(self.snapshot_path):
+            PickleStorage(self.snapshot_path).restore(library)
+        self._replay(library, self._rotated_path)
+        self._write_snapshot(pickle.dumps(library))
+        os.remove(self._rotated_path)
+
+    def _write_snapshot(self, snapshot):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    @staticmethod
+    def _replay(library, path):
+        replayed = 0
+        if not os.path.exists(path):
+            return replayed
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    changes = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final record from a crash
+                for kind, record in changes:
+                    library._apply_change(kind, record)
+                replayed += 1
+        return replayed
+
+    def compact(self):
+        """Fold the journal into the snapshot now and wait for it to finish."""
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            if self._file is None:
+                self._open_journal()
+            self._start_compaction()
+            compaction = self._compaction
+        compaction.join()
+
+    def save(self, library):
+        """Snapshot the whole library and start an empty journal."""
+        self._library = library
+        with self._lock:
+            if self._compaction is not None:
+                self._compaction.join()
+            self._write_snapshot(pickle.dumps(library))
+            # the snapshot already holds everything journaled so far
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.journal_path, "w", encoding="utf-8")
+            self._unsynced = 0
+            if os.path.exists(self._rotated_path):
+                os.remove(self._rotated_path)
+
+    def load(self, library):
+        self._library = library
+        if os.path.exists(self.snapshot_path):
+            PickleStorage(self.snapshot_path).load(library)
+        replayed = sum(self._replay(library, path) for path in (self._rotated_path, self.journal_path))
+        if replayed:
+            print(f"Replayed {replayed} journal record(s).")
+
+    def close(self):
+        if self._compaction is not None:
+            self._compaction.join()
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+
+def migrate_library(pickle_path="library.pkl", db_path="library.db"):
+    """Import a pickled library into a SQLite store, hashing any plaintext passwords on the way."""
+    library = Library(PickleStorage(pickle_path))
+    library.retrieve_library()
+    legacy = [m for m in itertools.chain(library.members, library._removed_members.values())
+              if not is_password_hash(m.password)]
+    if legacy:
+        # otherwise they would sit in the new store until each member logs in again
+        with ProcessPoolExecutor() as pool:
+            hashes = pool.map(hash_password, [str(m.password) for m in legacy], chunksize=max(1, len(legacy) // 64))
+            for member, password_hash in zip(legacy, hashes):
+                member.password = password_hash
+        print(f"Hashed {len(legacy)} plaintext password(s).")
+    storage = SQLiteStorage(db_path)
+    storage.write_all(library)
+    storage.close()
+    print(f"Imported {len(library.books)} books, {len(library.members)} members and "
+          f"{len(library.transactions)} transactions into {db_path}.")
+
+
+def read_records(path):
+    """Yield one dict per row of a .csv file (with a header) or a .jsonl file.
+
+    Undecodable JSONL lines are yielded as their raw text so the importer can
+    reject them by row number.
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if path.endswith(".csv"):
+            yield from csv.DictReader(file)
+            return
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield line
+
+
+def write_records(path, records):
+    """Stream records into a .csv or .jsonl file; list fields become JSON text in CSV."""
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = None
+        for record in records:
+            if not path.endswith(".csv"):
+                file.write(json.dumps(record) + "\n")
+            else:
+                if writer is None:
+                    writer = csv.DictWriter(file, fieldnames=list(record))
+                    writer.writeheader()
+                writer.writerow({k: json.dumps(v) if isinstance(v, list) else v for k, v in record.items()})
+            count += 1
+    return count
+
+
+def import_catalog(path, db_path="library.db"):
+    library = Library(SQLiteStorage(db_path))
+    library.retrieve_library()
+    imported, rejects = library.import_books(read_records(path))
+    for row, reason in rejects[:20]:
+        print(f"  row {row}: {reason}")
+    if len(rejects) > 20:
+        print(f"  ... and {len(rejects) - 20} more")
+    library.storage.close()
+
+
+def export_catalog(kind, path, db_path="library.db"):
+    library = Library(SQLiteStorage(db_path))
+    library.retrieve_library()
+    if kind == "catalog":
+        print(f"Exported {write_catalog_file(library.books, path)} books to {path}.")
+    else:
+        print(f"Exported {write_records(path, library.export_records(kind))} {kind} to {path}.")
+    library.storage.close()
+
+
+CATALOG_MAGIC = b"LIBCAT01"
+CATALOG_HEADER = struct.Struct("<8sQQQ")  # magic, book count, record index offset, search index offset
+
+def catalog_fields(book):
+    fields = [book.title, book.author, book.isbn, book.genre]
+    return [str(f or "").replace("\x1e", " ").replace("\x1f", " ") for f in fields]
+
+def write_catalog_file(books, path):
+    """Write books to an offset-indexed binary catalog that CatalogReplica maps read-only.
+
+    Layout after the header: the records (title, author, ISBN, genre,
+    available and total copies, joined by 0x1f), their offsets, then a search
+    section holding each book's lower-cased searchable fields and its offsets.
+    The file is written beside path and renamed over it, so replicas that
+    still map the old file keep a consistent view.
+    """
+    books = list(books)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(CATALOG_HEADER.pack(CATALOG_MAGIC, 0, 0, 0))
+        sections = []
+        for encode in (lambda fields, book: "\x1f".join(fields + [str(book.available_copies), str(book.total_copies)]),
+                       lambda fields, book: "\x1e" + "\x1f".join(f.lower() for f in fields)):
+            offsets = array("Q")
+            for book in books:
+                offsets.append(file.tell())
+                file.write(encode(catalog_fields(book), book).encode())
+            offsets.append(file.tell())
+            sections.append(file.tell())
+            file.write(offsets.tobytes())
+        file.seek(0)
+        file.write(CATALOG_HEADER.pack(CATALOG_MAGIC, len(books), *sections))
+    os.replace(tmp_path, path)
+    return len(books)
+
+
+class CatalogReplica:
+    """Read-only catalog search over a memory-mapped write_catalog_file file.
+
+    search_book and get_book_by_isbn behave like Library's. Substring
+    matching runs directly on the mapped search section, so processes that
+    share the file share its page cache. Matching books are decoded into
+    Book objects only when they are returned.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, record_index, search_index = CATALOG_HEADER.unpack_from(self._map)
+        if magic != CATALOG_MAGIC:
+            self._map.close()
+            raise ValueError(f"{path} is not a catalog file.")
+        view = memoryview(self._map)
+        size = 8 * (self._count + 1)
+        self._records = view[record_index:record_index + size].cast("Q")
+        self._search = view[search_index:search_index + size].cast("Q")
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (self.book(i) for i in range(self._count))
+
+    @property
+    def books(self):
+        return list(self)
+
+    def _fields(self, i):
+        return self._map[self._records[i]:self._records[i + 1]].decode().split("\x1f")
+
+    def book(self, i):
+        title, author, isbn, genre, available, total = self._fields(i)
+        book = Book(title, author, isbn, genre, total_copies=int(total))
+        book.available_copies = int(available)
+        return book
+
+    def _matches(self, needle):
+        """Indexes of books whose search entry contains needle, in catalog order."""
+        pos, end = self._search[0], self._search[self._count]
+        while (pos := self._map.find(needle, pos, end)) != -1:
+            i = bisect.bisect_right(self._search, pos) - 1
+            yield i
+            pos = self._search[i + 1]
+
+    def get_book_by_isbn(self, isbn):
+        key = normalize_key(isbn)
+        for i in self._matches(f"\x1f{key}\x1f".encode()):
+            # the needle can also hit an author equal to the ISBN
+            if self._map[self._search[i]:self._search[i + 1]].decode().split("\x1f")[2].strip() == key:
+                return self.book(i)
+        return None
+
+    def search_book(self, query):
+        q = str(query).strip().lower()
+        if not q:
+            return self.books or None
+        # a query with separators cannot fall inside a single field
+        results = [] if "\x1e" in q or "\x1f" in q else [self.book(i) for i in self._matches(q.encode())]
+
+        if not results:
+            titles = (self._fields(i)[0] for i in range(self._count))
+            matches = difflib.get_close_matches(q, titles, n=5, cutoff=0.5)
+            if matches:
+                wanted = Counter(matches)
+                same_title = {}
+                for i in range(self._count):
+                    if (title := self._fields(i)[0]) in wanted:
+                        same_title.setdefault(title, []).append(i)
+                for match in matches:
+                    results.extend(self.book(i) for i in same_title[match])
+
+        return results if results else None
+
+    def close(self):
+        self._records.release()
+        self._search.release()
+        self._map.close()
+
+
 def library_menu(library, librarian):
     while True:
         print("\n--- Librarian Menu ---")
@@ -463,24 +3177,32 @@ def library_menu(library, librarian):
                 librarian.add_book(book)
             case "3":
                 email = input("Enter member email to remove: ")
-                member = next((m for m in library.members if m.email == email), None)
+                member = library.get_member_by_email(email)
                 if member:
                     librarian.remove_member(member)
                 else:
                     print("Member not found.")
             case "4":
                 isbn = input("Enter book ISBN to remove: ")
-                book = next((b for b in library.books if b.isbn == isbn), None)
+                book = library.get_book_by_isbn(isbn)
                 if book:
                     librarian.remove_book(book)
                 else:
                     print("Book not found.")
             case "5":
-                library._view_transactions()
+                since = input("From borrow date (YYYY-MM-DD, blank for all): ").strip()
+                until = input("To borrow date (YYYY-MM-DD, blank for all): ").strip()
+                try:
+                    since = date.fromisoformat(since) if since else None
+                    until = date.fromisoformat(until) if until else None
+                except ValueError:
+                    print("Invalid date.")
+                    continue
+                browse(lambda offset: library._view_transactions(offset, since=since, until=until))
             case "6":
-                library._view_books()
+                browse(lambda offset: library._view_books(offset=offset))
             case "7":
-                library.print_users()
+                browse(library.print_users)
             case "8":
                 query = input("Enter query to search book: ")
                 results = library.search_book(query)
@@ -504,7 +3226,7 @@ def library_menu(library, librarian):
             case "10":
                 email = input("Enter member email: ")
                 title = input("Enter book title or ISBN: ")
-                member = next((m for m in library.members if m.email == email), None)
+                member = library.get_member_by_email(email)
                 if member:
                     library.borrow_book(member, title)
                 else:
@@ -512,7 +3234,7 @@ def library_menu(library, librarian):
             case "11":
                 email = input("Enter member email: ")
                 title = input("Enter book title or ISBN: ")
-                member = next((m for m in library.members if m.email == email), None)
+                member = library.get_member_by_email(email)
                 if member:
                     library.return_book(member, title)
                 else:
@@ -535,7 +3257,8 @@ def member_menu(library, member):
         print("6.View Recommendations")
         print("7.View Notifications")
         print("8.Clear Dues")
-        print("9.Logout")
+        print("9.Cancel Reservation")
+        print("10.Logout")
 
         match input("Enter your choice: "):
             case "1":
@@ -544,7 +3267,7 @@ def member_menu(library, member):
                 title = input("Enter book title to search: ")
                 member.search_book(title, library)
             case "3":
-                member.view_pending_dues()
+                library.view_pending_dues(member)
             case "4":
                 forgot_password(library)
             case "5":
@@ -553,9 +3276,7 @@ def member_menu(library, member):
                 if not books:
                     print(f"No book found with title or ISBN '{title}'.")
                     continue
-                book = books[0]
-                if book.reserve_book(member):
-                    member.reserved_books.append(book)
+                library.reserve_book(member, books[0])
             case "6":
                 recs = library.recommend_books(member, mode="personalized")
                 if recs:
@@ -565,10 +3286,18 @@ def member_menu(library, member):
                 else:
                     print("No personalized recommendations yet.")
             case "7":
-                member.view_notifications()
+                library.view_notifications(member)
             case "8":
-                member.clear_dues()
+                library.clear_dues(member)
             case "9":
+                member.view_reservations()
+                isbn = input("Enter ISBN of the reservation to cancel: ")
+                book = library.get_book_by_isbn(isbn)
+                if book and library.cancel_reservation(member, book):
+                    print(f"Reservation for '{book.title}' cancelled.")
+                else:
+                    print("No such reservation.")
+            case "10":
                 print("Logging out...")
                 return
             
@@ -577,8 +3306,11 @@ def member_menu(library, member):
                 continue
 
 def main():
-    library = Library()
+    if not os.path.exists("library.db") and os.path.exists("library.pkl"):
+        migrate_library("library.pkl", "library.db")
+    library = Library(SQLiteStorage("library.db", lazy_history=True))
     library.retrieve_library()
+    library.outbox.start(library._record)
     librarian = Librarian("Alice", 40, "alice@gmail.com", "Admin@123", library)
     library.librarian = librarian   
 
@@ -586,6 +3318,7 @@ def main():
     running = True
 
     while running:
+        library.run_scheduler()
         choice = input("\nLogin (l) or quit (q) forgot password (fp): ")
         if choice.lower() == "l":
             user = signin(library)
@@ -603,7 +3336,9 @@ def main():
         elif choice.lower() == "q":
             running = False
             print("Exiting...")
+            library.outbox.stop()
             library.save_library()
+            library.storage.close()
         elif choice.lower() == "fp":
             forgot_password(library)
                 
@@ -611,4 +3346,11 @@ def main():
             print("Invalid choice.")
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ["migrate"]:
+        migrate_library(*sys.argv[2:4])
+    elif sys.argv[1:2] == ["import"]:
+        import_catalog(*sys.argv[2:4])
+    elif sys.argv[1:2] == ["export"]:
+        export_catalog(*sys.argv[2:5])
+    else:
+        main()
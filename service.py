@@ -0,0 +1,220 @@
+"""Asyncio line-protocol front-end for a shared Library.
+
+Each request is one JSON object per line, e.g.
+``{"op": "borrow", "email": "a@b.com", "book": "Dune"}``, and each response
+is one JSON line ``{"ok": true, "result": ..., "messages": [...]}``.
+``messages`` carries whatever the Library printed while serving the request
+(only that request: see project.captured_output).
+Member ops take either ``email`` or a ``session`` token returned by ``login``.
+
+Run with ``python service.py [host] [port]``.
+"""
+import asyncio
+import json
+import sys
+
+from project import Library, SQLiteStorage, captured_output, metrics
+
+STREAM_LIMIT = 16 * 1024 * 1024
+SCHEDULER_INTERVAL = 60  # seconds between overdue/hold checks
+
+# expected JSON type of each optional request field
+FIELDS = {"email": str, "password": str, "session": str, "book": str, "query": str, "query_title": str,
+          "mode": str, "limit": int, "n": int, "tier": int, "reserve": bool, "enable": bool, "memory": bool}
+COUNTS = ("limit", "n", "tier")
+KIND_NAMES = {str: "a string", int: "an integer", bool: "true or false"}
+
+
+def book_summary(book):
+    return {"title": book.title, "author": book.author, "isbn": book.isbn, "genre": book.genre,
+            "available_copies": book.available_copies, "total_copies": book.total_copies}
+
+
+def check_fields(request):
+    """Raise ValueError if an optional field has the wrong JSON type."""
+    for name, kind in FIELDS.items():
+        if name not in request:
+            continue
+        value = request[name]
+        # bool is an int subclass, but true is not a count
+        if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+            raise ValueError(f"'{name}' must be {KIND_NAMES[kind]}.")
+        if name in COUNTS and value < 0:
+            raise ValueError(f"'{name}' must not be negative.")
+
+
+class LibraryService:
+    """Maps request dictionaries onto Library operations."""
+
+    # ops that burn CPU for long enough to stall every other client (password hashing)
+    BLOCKING_OPS = frozenset({"login"})
+
+    def __init__(self, library):
+        self.library = library
+
+    def _member(self, request):
+        if "session" in request:
+            member = self.library.session_member(request["session"])
+            if member is None:
+                raise LookupError("Session expired or unknown; log in again.")
+            return member
+        member = self.library.get_member_by_email(request.get("email", ""))
+        if member is None:
+            raise LookupError(f"No member with email '{request.get('email')}'.")
+        return member
+
+    def _book(self, request):
+        book = self.library._find_book(request.get("book", ""))
+        if book is None:
+            raise LookupError(f"No book found with title or ISBN '{request.get('book')}'.")
+        return book
+
+    def op_login(self, request):
+        token = self.library.login(request.get("email", ""), request.get("password", ""))
+        if token is None:
+            raise LookupError("Invalid email or password.")
+        return token
+
+    def op_search(self, request):
+        books = self.library.search_book(request.get("query", "")) or []
+        return [book_summary(b) for b in books[:request.get("limit", 50)]]
+
+    def op_borrow(self, request):
+        transaction = self.library.borrow_book(self._member(request), request.get("book", ""),
+                                               reserve=request.get("reserve", False))
+        return transaction.due_date.isoformat() if transaction else None
+
+    def op_return(self, request):
+        return self.library.return_book(self._member(request), request.get("book", ""))
+
+    def op_reserve(self, request):
+        return self.library.reserve_book(self._member(request), self._book(request), request.get("tier", 0))
+
+    def op_cancel(self, request):
+        return self.library.cancel_reservation(self._member(request), self._book(request))
+
+    def op_recommend(self, request):
+        member = self._member(request) if "email" in request or "session" in request else None
+        return self.library.recommend_books(member, mode=request.get("mode", "generic"),
+                                            query_title=request.get("query_title"), n=request.get("n", 3))
+
+    def op_notifications(self, request):
+        member = self._member(request)
+        notes = list(member.notifications)
+        self.library.view_notifications(member)
+        return notes
+
+    def op_dues(self, request):
+        member = self._member(request)
+        library = self.library
+        today = library.today()
+        # per-loan fines net of payments made while the loan was open, as in the total
+        overdue = [(t, t.calculate_fine(today) - library._ledger.prepaid.get(t.id, 0.0))
+                   for t in library.open_loans(member) if t.due_date < today]
+        return {"total": library.outstanding_fine(member, today),
+                "returned_books": library._ledger.balances.get(member, 0.0),
+                "overdue": [{"transaction": t.id, "title": t.book.title, "fine": max(0.0, fine)}
+                            for t, fine in overdue]}
+
+    def op_metrics(self, request):
+        """Switch instrumentation with "enable": true/false and return the current metrics and cache stats."""
+        if "enable" in request:
+            if request["enable"]:
+                metrics.enable(memory=request.get("memory", False))
+            else:
+                metrics.disable()
+        return dict(json.loads(metrics.report("json")), cache=self.library.query_cache.stats())
+
+    def handle(self, request):
+        if not isinstance(request, dict):
+            return {"ok": False, "error": "Requests must be JSON objects."}
+        handler = getattr(self, f"op_{request.get('op')}", None)
+        if handler is None:
+            return {"ok": False, "error": f"Unknown op '{request.get('op')}'."}
+        try:
+            check_fields(request)
+            with captured_output() as output:
+                result = handler(request)
+        except (LookupError, ValueError) as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            # a bug in one op must not drop the client's connection
+            return {"ok": False, "error": f"Internal error: {type(e).__name__}: {e}"}
+        return {"ok": True, "result": result, "messages": output.getvalue().splitlines()}
+
+
+async def handle_connection(service, reader, writer):
+    try:
+        while line := await reader.readline():
+            try:
+                request = json.loads(line)
+                if isinstance(request, dict) and request.get("op") in service.BLOCKING_OPS:
+                    response = await asyncio.to_thread(service.handle, request)
+                else:
+                    response = service.handle(request)
+            except ValueError:  # JSONDecodeError or undecodable bytes
+                response = {"ok": False, "error": "Requests must be JSON objects."}
+            writer.write(json.dumps(response).encode() + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def start_server(library, host="127.0.0.1", port=8765):
+    service = LibraryService(library)
+    return await asyncio.start_server(lambda r, w: handle_connection(service, r, w), host, port,
+                                      limit=STREAM_LIMIT)
+
+
+class LibraryClient:
+    """Minimal async client; one request in flight per connection."""
+
+    def __init__(self, reader, writer):
+        self._reader = reader
+        self._writer = writer
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=8765):
+        reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def call(self, op, **params):
+        async with self._lock:
+            self._writer.write(json.dumps({"op": op, **params}).encode() + b"\n")
+            await self._writer.drain()
+            return json.loads(await self._reader.readline())
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+
+async def run_scheduler(library, interval=SCHEDULER_INTERVAL):
+    """Fire due overdue reminders and hold expiries until cancelled."""
+    while True:
+        await asyncio.to_thread(library.run_scheduler)
+        await asyncio.sleep(interval)
+
+
+async def serve(host="127.0.0.1", port=8765, db_path="library.db"):
+    library = Library(SQLiteStorage(db_path))
+    library.retrieve_library()
+    library.outbox.start(library._record)
+    server = await start_server(library, host, port)
+    scheduler = asyncio.create_task(run_scheduler(library))
+    print(f"Serving library on {host}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        scheduler.cancel()
+        library.outbox.stop()
+        library.storage.close()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(serve(args[0] if args else "127.0.0.1", int(args[1]) if len(args) > 1 else 8765))
@@ -0,0 +1,384 @@
+"""Sharded deployment: one Library per worker process behind a router.
+
+Books are placed on a shard by a hash of their ISBN and members by a hash of
+their email. ShardedLibrary offers search_book, borrow_book, return_book and
+recommend_books over the shards, talking to each worker through a
+multiprocessing pipe:
+
+- search_book asks every shard at once and merges the answers; fuzzy title
+  matches are only used when no shard has a direct match, as in Library.
+- A loan lives on the member's shard, which keeps the member's history, fines
+  and recommendations. When the book lives elsewhere its shard gives up a
+  copy first and the member's shard records the loan against a local,
+  uncatalogued copy of the book record; a failed loan puts the copy back.
+  Returns run the same way in reverse.
+- Genre popularity is counted on the book's shard, so personalized
+  recommendations take co-borrow picks from the member's shard and fill up
+  with the favourite genre's most borrowed books over all shards. A
+  restarted shard recounts only the loans recorded on it.
+
+Everything runs on one machine: ``ShardedLibrary(4)`` starts four worker
+processes (with in-memory databases unless db_path is given).
+"""
+import difflib
+import heapq
+import multiprocessing
+import threading
+import zlib
+
+from project import (BORROW_LIMIT, Book, Library, Member, SQLiteStorage, book_record, captured_output,
+                     member_record_problem, normalize_key)
+
+
+def shard_of(key, n_shards):
+    """Stable shard number for an ISBN or email."""
+    return zlib.crc32(normalize_key(key).encode()) % n_shards
+
+
+class ShardWorker:
+    """Maps router requests onto the Library of one shard."""
+
+    def __init__(self, library):
+        self.library = library
+
+    def _member(self, email):
+        member = self.library.get_member_by_email(email)
+        if member is None:
+            raise LookupError(f"No member with email '{email}'.")
+        return member
+
+    def _book(self, isbn):
+        book = self.library.get_book_by_isbn(isbn)
+        if book is None:
+            raise LookupError(f"No book with ISBN '{isbn}'.")
+        return book
+
+    def op_add_books(self, records):
+        books = [Book(record["title"], record["author"], record["isbn"], record["genre"], record.get("description"),
+                      total_copies=record.get("total_copies", 1)) for record in records]
+        return len(self.library._add_books(books))
+
+    def op_add_member(self, name, age, email, password):
+        """Register a member with the same checks as the bulk registration; prints why a record is refused."""
+        if problem := member_record_problem({"name": name, "age": age, "email": email, "password": password}):
+            print(f"Member not registered: {problem}")
+            return False
+        member = Member(name, int(age), email.strip(), password)
+        self.library._add_member(member)
+        return self.library.get_member_by_email(email) is member
+
+    def op_search_book(self, query):
+        """(direct, records): direct is False when the records are only close title matches."""
+        q = normalize_key(query)
+        books = self.library.search_book(query) or []
+        if not books:
+            return False, []
+        first = books[0]
+        direct = any(q in field.lower() for field in (first.title, first.author, first.isbn, first.genre))
+        return direct, [book_record(book) for book in books]
+
+    def op_find_book(self, title_or_isbn):
+        """The record of the book with this ISBN or exact title, or None."""
+        book = self.library.get_book_by_isbn(title_or_isbn)
+        if book is None and (same_title := self.library.get_books_by_title(title_or_isbn)):
+            book = same_title[0]
+        return book_record(book) if book else None
+
+    def op_borrow_book(self, email, isbn):
+        """Borrow a book held on this shard; returns the due date or None."""
+        transaction = self.library.borrow_book(self._member(email), isbn, reserve=False)
+        return transaction.due_date.isoformat() if transaction else None
+
+    def op_check_borrower(self, email):
+        """Whether the member may borrow another book; prints why not."""
+        member = self._member(email)
+        if len(member.borrowed_books) >= BORROW_LIMIT:
+            print(f"Borrowing limit reached. You can borrow up to {BORROW_LIMIT} books.")
+            return False
+        if (fine := self.library.outstanding_fine(member)) > 0:
+            print(f"Cannot borrow. Outstanding fine: Rs.{fine}.")
+            return False
+        return True
+
+    def op_take_copy(self, isbn):
+        """Take one copy of a book for a loan recorded on another shard."""
+        book = self._book(isbn)
+        with self.library._book_locks(normalize_key(book.isbn)):
+            if not book.borrow_copy():
+                return None
+            self.library._record(("book", book))
+        return book_record(book)
+
+    def op_put_copy(self, isbn):
+        """Give back a copy taken by take_copy."""
+        library = self.library
+        book = library._lookup_book(isbn)
+        if book is None:
+            raise LookupError(f"No book with ISBN '{isbn}'.")
+        with library._book_locks(normalize_key(book.isbn)):
+            book.return_copy()
+            library._record(("book", book))
+
+    def op_open_loan(self, email, record):
+        """Record a loan of a copy taken on the book's shard; returns the due date or None."""
+        library = self.library
+        member = self._member(email)
+        book = library._lookup_book(record["isbn"])
+        if book is None:
+            library._apply_change("book", dict(record, reservations=[], holds=[], removed=True))
+            book = library._lookup_book(record["isbn"])
+        with library._circulation_lock(member, book):
+            if len(member.borrowed_books) >= BORROW_LIMIT:
+                print(f"Borrowing limit reached. You can borrow up to {BORROW_LIMIT} books.")
+                return None
+            # the copy itself was taken on the book's shard
+            book.available_copies = 1
+            transaction = library._issue(member, book)
+            book.available_copies = 0
+        return transaction.due_date.isoformat() if transaction else None
+
+    def op_return_book(self, email, isbn):
+        return self.library.return_book(self._member(email), isbn)
+
+    def op_personal_picks(self, email, n):
+        """(titles, genre, skip ISBNs): co-borrow picks and favourite genre, for the router to fill up from every shard."""
+        library = self.library
+        member = self._member(email)
+        with library._history_lock:
+            recommender = library._recommender
+            skip = set(member.borrowed_books) | recommender.history.get(member, set())
+            picked = recommender.co_borrowed(member, n, skip)
+            genre = recommender.favourite_genre(member)
+        return [book.title for book in picked], genre, [book.isbn for book in skip | set(picked)]
+
+    def op_popular_in_genre(self, genre, n, skip_isbns):
+        """[(borrows, title)] of this shard's n most borrowed books in genre."""
+        library = self.library
+        skip = {book for book in map(library._lookup_book, skip_isbns) if book is not None}
+        with library._history_lock:
+            ranking = library._recommender.popular.get(genre)
+            return [(ranking.counts[book], book.title) for book in ranking.top(n, skip)] if ranking else []
+
+    def op_count_borrow(self, isbn):
+        """Count a loan recorded on another shard towards this book's popularity."""
+        with self.library._history_lock:
+            self.library._recommender.count_borrow(self._book(isbn))
+
+    def op_similar_titles(self, query_title, n):
+        return self.library.recommend_books(None, mode="generic", query_title=query_title, n=n)
+
+    def op_counts(self):
+        return {"books": len(self.library.books), "members": len(self.library.members),
+                "transactions": len(self.library.transactions)}
+
+    def handle(self, op, args):
+        try:
+            with captured_output() as output:
+                result = getattr(self, f"op_{op}")(*args)
+        except Exception as e:
+            # a bad request must not take the shard down with it; only our own lookups are plain LookupErrors
+            error = str(e) if type(e) is LookupError else f"{op} failed: {type(e).__name__}: {e}"
+            return False, error, output.getvalue().splitlines()
+        return True, result, output.getvalue().splitlines()
+
+
+def serve_shard(conn, db_path):
+    """Worker process body: answer (op, args) requests until None arrives."""
+    library = Library(SQLiteStorage(db_path))
+    with captured_output():
+        library.retrieve_library()
+    library.outbox.start(library._record)
+    worker = ShardWorker(library)
+    try:
+        while (request := conn.recv()) is not None:
+            conn.send(worker.handle(*request))
+    finally:
+        library.outbox.stop()
+        library.storage.close()
+        conn.close()
+
+
+class ShardedLibrary:
+    """Routes Library operations to worker processes that each own a shard.
+
+    Workers print nothing themselves; whatever a shard printed while serving
+    a request is printed by the router. Safe to call from many threads:
+    requests to different shards run in parallel.
+    """
+
+    def __init__(self, n_shards=4, db_path=None):
+        self.n_shards = n_shards
+        self._conns = []
+        self._locks = [threading.Lock() for _ in range(n_shards)]
+        self._processes = []
+        for i in range(n_shards):
+            parent, child = multiprocessing.Pipe()
+            path = ":memory:" if db_path is None else f"{db_path}.shard{i}"
+            process = multiprocessing.Process(target=serve_shard, args=(child, path), daemon=True)
+            process.start()
+            child.close()
+            self._conns.append(parent)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _call(self, shard, op, *args):
+        return self._gather([shard], op, *args)[0]
+
+    def _gather(self, shards, op, *args):
+        """Send op to the shards, then collect their results in shard order."""
+        return self._gather_each(shards, op, [args] * len(shards))
+
+    def _gather_each(self, shards, op, shard_args):
+        """Like _gather, with separate arguments for each shard."""
+        locks = [self._locks[shard] for shard in sorted(set(shards))]
+        for lock in locks:
+            lock.acquire()
+        try:
+            for shard, args in zip(shards, shard_args):
+                self._conns[shard].send((op, args))
+            replies = [self._conns[shard].recv() for shard in shards]
+        finally:
+            for lock in locks:
+                lock.release()
+        results = []
+        for ok, result, messages in replies:
+            for line in messages:
+                print(line)
+            if not ok:
+                print(result)
+                result = None
+            results.append(result)
+        return results
+
+    def _scatter(self, op, *args):
+        return self._gather(range(self.n_shards), op, *args)
+
+    def book_shard(self, isbn):
+        return shard_of(isbn, self.n_shards)
+
+    def member_shard(self, email):
+        return shard_of(email, self.n_shards)
+
+    def add_book(self, title, author, isbn, genre, description=None, total_copies=1):
+        record = {"title": title, "author": author, "isbn": isbn, "genre": genre, "description": description,
+                  "total_copies": total_copies}
+        return self._call(self.book_shard(isbn), "add_books", [record]) == 1
+
+    def add_books(self, records):
+        """Add book dicts (isbn, title, author, genre, ...) in one batch per shard; returns how many were new."""
+        batches = [[] for _ in range(self.n_shards)]
+        for record in records:
+            batches[self.book_shard(record["isbn"])].append(record)
+        shards = [i for i, batch in enumerate(batches) if batch]
+        return sum(self._gather_each(shards, "add_books", [(batches[i],) for i in shards]))
+
+    def add_member(self, name, age, email, password):
+        return self._call(self.member_shard(email), "add_member", name, age, email, password)
+
+    def search_book(self, query):
+        """Book records from every shard, direct matches first; None when nothing matches."""
+        answers = self._scatter("search_book", query)
+        direct = [records for is_direct, records in answers if is_direct]
+        if direct:
+            return [record for records in direct for record in records]
+        # no direct match anywhere: keep the five best close titles over all shards
+        by_title = {}
+        for _, records in answers:
+            for record in records:
+                by_title.setdefault(record["title"], []).append(record)
+        # best first, as Library lists its close matches
+        results = [record for title in self._best_titles(normalize_key(query), by_title, 5)
+                   for record in by_title[title]]
+        return results or None
+
+    @staticmethod
+    def _best_titles(word, titles, n):
+        """The n titles closest to word, scored the way the shards' Library scores them."""
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(word)
+        scored = []
+        for title in titles:
+            matcher.set_seq1(title)
+            scored.append((matcher.ratio(), title))
+        return [title for score, title in heapq.nlargest(n, scored)]
+
+    def find_book(self, title_or_isbn):
+        """Record of the book by ISBN, then exact title, then the first search hit."""
+        if record := self._call(self.book_shard(title_or_isbn), "find_book", title_or_isbn):
+            return record
+        for record in self._scatter("find_book", title_or_isbn):
+            if record:
+                return record
+        results = self.search_book(title_or_isbn)
+        return results[0] if results else None
+
+    def borrow_book(self, email, title_or_isbn):
+        """Issue a copy to the member; returns the due date (ISO string) or None."""
+        book = self.find_book(title_or_isbn)
+        if book is None:
+            print(f"No book found with title or ISBN '{title_or_isbn}'.")
+            return None
+        member_shard, book_shard = self.member_shard(email), self.book_shard(book["isbn"])
+        if member_shard == book_shard:
+            return self._call(member_shard, "borrow_book", email, book["isbn"])
+        if not self._call(member_shard, "check_borrower", email):
+            return None
+        taken = self._call(book_shard, "take_copy", book["isbn"])
+        if taken is None:
+            print(f"No available copies for '{book['title']}'.")
+            return None
+        due = self._call(member_shard, "open_loan", email, taken)
+        if due is None:
+            self._call(book_shard, "put_copy", book["isbn"])
+        else:
+            self._call(book_shard, "count_borrow", book["isbn"])
+        return due
+
+    def return_book(self, email, title_or_isbn):
+        """Close the member's loan of the book; returns the fine or None."""
+        book = self.find_book(title_or_isbn)
+        if book is None:
+            print(f"No book found with title or ISBN '{title_or_isbn}'.")
+            return None
+        member_shard, book_shard = self.member_shard(email), self.book_shard(book["isbn"])
+        fine = self._call(member_shard, "return_book", email, book["isbn"])
+        if fine is not None and member_shard != book_shard:
+            self._call(book_shard, "put_copy", book["isbn"])
+        return fine
+
+    def recommend_books(self, email=None, mode="generic", query_title=None, n=3):
+        """Co-borrow picks come from the member's shard; genre and generic ones are merged over all shards."""
+        if mode == "personalized" and email:
+            if (answer := self._call(self.member_shard(email), "personal_picks", email, n)) is None:
+                return []
+            picked, genre, skip = answer
+            if len(picked) < n and genre:
+                # ties go to the lower shard, which is the best Library's insertion order can do across shards
+                popular = [pair for pairs in self._scatter("popular_in_genre", genre, n - len(picked), skip)
+                           for pair in pairs or ()]
+                picked += [title for borrows, title in sorted(popular, key=lambda pair: -pair[0])[:n - len(picked)]]
+            return picked
+        if mode != "generic" or not query_title:
+            return []
+        titles = [title for titles in self._scatter("similar_titles", query_title, n) for title in titles or ()]
+        return self._best_titles(query_title, titles, n)
+
+    def counts(self):
+        """Books, members and transactions held by each shard."""
+        return self._scatter("counts")
+
+    def close(self):
+        for i, (conn, process) in enumerate(zip(self._conns, self._processes)):
+            with self._locks[i]:
+                try:
+                    conn.send(None)
+                except (BrokenPipeError, OSError):
+                    pass
+            process.join(timeout=10)
+            conn.close()
+        self._conns, self._processes = [], []
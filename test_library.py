@@ -0,0 +1,413 @@
+import difflib
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import project
+from benchmark import build_library, stress_circulation
+from project import (Book, FuzzyMatcher, JournalStorage, Library, Member, NotificationOutbox, PickleStorage,
+                     SQLiteStorage)
+
+
+def test_expired_sessions_are_swept(monkeypatch):
+    library = Library()
+    library._add_member(Member("Ada", 30, "ada@example.com", "Passw0rd!"))
+    now = [1000.0]
+    monkeypatch.setattr(project.time, "monotonic", lambda: now[0])
+    stale = [library.login("ada@example.com", "Passw0rd!") for _ in range(3)]
+    now[0] += project.SESSION_TTL + project.SESSION_SWEEP
+    fresh = library.login("ada@example.com", "Passw0rd!")
+    assert list(library._sessions) == [fresh]
+    assert all(library.session_member(token) is None for token in stale)
+
+
+def test_fuzzy_workers_follow_catalog_changes():
+    library = Library()
+    library.fuzzy = FuzzyMatcher(2, min_parallel=10)
+    words = "shadow night river garden empire secret silent winter golden house".split()
+    rng = random.Random(1)
+    books = [Book(" ".join(rng.sample(words, 3)), "Author", f"isbn-{i}", "Genre") for i in range(60)]
+    queries = ["shadw nigt river", "golden huse", "wintr secret empire"]
+
+    def check():
+        titles = [book.title for book in library.books]
+        for query in queries:
+            assert library._close_titles(query, 3, 0.3) == difflib.get_close_matches(query, titles, 3, 0.3)
+    try:
+        for book in books:
+            library._add_book(book)
+        check()
+        executors = list(library.fuzzy._executors)
+        for book in books[:40]:
+            library._remove_book(book)
+        library._add_book(Book("golden house", "Author", "isbn-new", "Genre"))
+        check()
+        assert library.fuzzy._executors == executors  # updated in place, not restarted
+    finally:
+        library.fuzzy.close()
+
+
+def test_concurrent_circulation_keeps_copy_invariants():
+    # asserts available copies stay in range and agree with the open loans
+    stress_circulation(n_threads=8, n_ops=300, n_books=3, copies=2)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_compute_fines_matches_calculate_fine(compact):
+    library = build_library(50, 20, 2_000, compact=compact)
+    as_of = date(2025, 1, 1)
+    ids, fines = library.compute_fines(as_of)
+    assert list(ids) == [t.id for t in library.transactions]
+    assert list(fines) == [t.calculate_fine(as_of) for t in library.transactions]
+    members = library.members[:5]
+    ids, fines = library.compute_fines(as_of, members)
+    assert list(fines) == [t.calculate_fine(as_of) for m in members for t in m.transactions]
+
+
+def test_journal_survives_concurrent_writes_and_compaction(tmp_path):
+    paths = str(tmp_path / "library.pkl"), str(tmp_path / "library.journal")
+    library = Library(JournalStorage(*paths, compact_bytes=4_000))
+    library.retrieve_library()
+    books = [Book(f"Title {i}", "Author", f"isbn-{i}", "Genre", total_copies=2) for i in range(4)]
+    members = [Member(f"Member {i}", 20, f"member{i}@example.com", "Passw0rd!") for i in range(6)]
+    for book in books:
+        library._add_book(book)
+    for member in members:
+        library._add_member(member)
+
+    def worker(member, rng):
+        for _ in range(150):
+            book = rng.choice(books)
+            if rng.random() < 0.5:
+                library.borrow_book(member, book.isbn, reserve=False)
+            else:
+                library.return_book(member, book.isbn)
+    threads = [threading.Thread(target=worker, args=(m, random.Random(i))) for i, m in enumerate(members)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    library.storage.close()
+
+    def state(library):
+        return (sorted((b.isbn, b.available_copies) for b in library.books),
+                sorted((m.email, sorted(b.isbn for b in m.borrowed_books)) for m in library.members),
+                len(library.transactions))
+    for compact in (False, True):
+        reloaded = Library(JournalStorage(*paths), compact=compact)
+        reloaded.retrieve_library()
+        assert state(reloaded) == state(library)
+
+
+def test_search_during_add_book_does_not_cache_a_stale_result():
+    library = Library()
+    library._add_book(Book("Dune", "Frank Herbert", "isbn-1", "Science Fiction"))
+    during = []
+
+    class SearchOnInsert(dict):
+        # runs a lock-free search in the middle of _index_book
+        def __setitem__(self, key, value):
+            during.append([b.title for b in library.search_book("dune")])
+            super().__setitem__(key, value)
+    library._books_by_isbn = SearchOnInsert(library._books_by_isbn)
+    library._add_book(Book("Dune Messiah", "Frank Herbert", "isbn-2", "Science Fiction"))
+    assert during == [["Dune"]]
+    assert [b.title for b in library.search_book("dune")] == ["Dune", "Dune Messiah"]
+    library._remove_book(library.get_book_by_isbn("isbn-2"))
+    assert [b.title for b in library.search_book("dune")] == ["Dune"]
+
+
+def test_removed_books_are_not_recommended():
+    library = Library()
+    books = [Book(f"T{i}", "Author", f"x{i}", "Genre", total_copies=5) for i in range(4)]
+    for book in books:
+        library._add_book(book)
+    a = Member("A", 30, "a@example.com", "Passw0rd!")
+    b = Member("B", 30, "b@example.com", "Passw0rd!")
+    library._add_member(a)
+    library._add_member(b)
+    for book in books[:2]:
+        library.borrow_book(a, book.isbn, reserve=False)
+    library.borrow_book(b, "x0", reserve=False)
+    assert "T1" in library.recommend_books(b, mode="personalized")
+    library._remove_book(books[1])
+    assert "T1" not in library.recommend_books(b, mode="personalized")
+
+
+def test_removals_keep_the_catalog_in_insertion_order(tmp_path):
+    library = Library()
+    books = [Book(f"T{i}", "Author", f"x{i}", "Genre") for i in range(10)]
+    library._add_books(books)
+    for book in books[1::2]:
+        library._remove_book(book)
+    kept = books[::2]
+    assert list(library.books) == kept and len(library.books) == 5
+    assert library.books[1] is books[2] and library.books[-1] is books[8] and library.books[:2] == kept[:2]
+    assert books[1] not in library.books and books[2] in library.books
+    library._remove_book(books[0])  # holes now outnumber books, so the slots are compacted
+    assert library.books._holes == 0 and list(library.books) == kept[1:]
+    library._add_book(books[1])
+    assert list(library.books) == kept[1:] + [books[1]]
+    assert library.search_book("")[-1] is books[1]
+
+    path = str(tmp_path / "library.pkl")
+    PickleStorage(path).save(library)
+    copy = Library(PickleStorage(path))
+    copy.retrieve_library()
+    assert [b.isbn for b in copy.books] == ["x2", "x4", "x6", "x8", "x1"]
+
+
+class ViewsAtOnce(Member):
+    """A member who reads (and so clears) a hold notice the moment it arrives.
+
+    Hold notices are sent while only the returning member's lock is held, so
+    the reserver's own view_notifications can run at that point.
+    """
+    __slots__ = ()
+
+    def notify(self, message):
+        super().notify(message)
+        if "held for you" in message:
+            self.view_notifications()
+
+
+def test_hold_notice_survives_a_concurrent_view():
+    library = Library()
+    book = Book("Dune", "Frank Herbert", "isbn-1", "Science Fiction", total_copies=1)
+    library._add_book(book)
+    a = Member("A", 30, "a@example.com", "Passw0rd!")
+    b = ViewsAtOnce("B", 30, "b@example.com", "Passw0rd!")
+    library._add_member(a)
+    library._add_member(b)
+    library.borrow_book(a, "isbn-1", reserve=False)
+    assert library.reserve_book(b, book)
+    library.return_book(a, "isbn-1")
+    messages = [event.message for event in library.outbox.pending.values() if event.email == b.email]
+    assert any("held for you" in message for message in messages)
+
+
+def test_concurrent_flushes_deliver_each_event_once():
+    delivered = []
+
+    def slow_delivery(email, messages):
+        time.sleep(0.05)
+        delivered.extend(messages)
+    outbox = NotificationOutbox(slow_delivery)
+    for i in range(5):
+        outbox.put(f"m{i}@example.com", f"note {i}")
+    threads = [threading.Thread(target=outbox.flush) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(delivered) == [f"note {i}" for i in range(5)]
+    assert len(outbox) == 0
+
+
+def clocked_library(copies=1):
+    clock = project.SimulatedClock(date(2025, 1, 1))
+    library = Library(clock=clock)
+    book = Book("Dune", "Frank Herbert", "isbn-1", "Science Fiction", total_copies=copies)
+    library._add_book(book)
+    members = [Member(f"M{i}", 30, f"m{i}@example.com", "Passw0rd!") for i in range(3)]
+    for member in members:
+        library._add_member(member)
+    return clock, library, book, members
+
+
+def outbox_messages(library, member):
+    return [event.message for event in library.outbox.pending.values() if event.email == member.email]
+
+
+def test_overdue_reminders_fire_and_repeat():
+    clock, library, book, (a, *_) = clocked_library()
+    transaction = library.borrow_book(a, "isbn-1", reserve=False)
+    clock.today = transaction.due_date
+    assert library.run_scheduler() == 0
+    clock.today += timedelta(days=1)
+    assert library.run_scheduler() == 1
+    assert "Fine so far" in outbox_messages(library, a)[-1]
+    clock.today += timedelta(days=project.REMINDER_DAYS - 1)
+    assert library.run_scheduler() == 0
+    clock.today += timedelta(days=1)
+    assert library.run_scheduler() == 1
+    assert sum("Fine so far" in message for message in outbox_messages(library, a)) == 2
+    library.return_book(a, "isbn-1")
+    clock.today += timedelta(days=project.REMINDER_DAYS)
+    assert library.run_scheduler() == 0  # returning cancels the reminders
+
+
+def test_expired_hold_passes_the_copy_to_the_next_reserver():
+    clock, library, book, (a, b, c) = clocked_library()
+    library.borrow_book(a, "isbn-1", reserve=False)
+    assert library.reserve_book(b, book) and library.reserve_book(c, book)
+    library.return_book(a, "isbn-1")
+    assert b in book.holds and library.borrow_book(c, "isbn-1", reserve=False) is None
+    clock.today += timedelta(days=project.HOLD_DAYS)
+    assert library.run_scheduler() == 0
+    clock.today += timedelta(days=1)
+    assert library.run_scheduler() == 1
+    assert b not in book.holds and c in book.holds
+    assert any("has expired" in message for message in outbox_messages(library, b))
+    assert library.borrow_book(b, "isbn-1", reserve=False) is None
+    assert library.borrow_book(c, "isbn-1", reserve=False) is not None
+
+
+def test_borrowing_a_held_copy_cancels_the_hold_timer():
+    clock, library, book, (a, b, _) = clocked_library()
+    library.borrow_book(a, "isbn-1", reserve=False)
+    assert library.reserve_book(b, book)
+    library.return_book(a, "isbn-1")
+    assert len(library.scheduler) == 1  # b's hold
+    assert library.borrow_book(b, "isbn-1", reserve=False) is not None
+    assert len(library.scheduler) == 1  # only b's overdue reminder is left
+    clock.today += timedelta(days=project.HOLD_DAYS + 1)
+    assert library.run_scheduler() == 0
+
+
+def test_fine_ledger_settles_once_and_survives_a_reload(tmp_path):
+    path = str(tmp_path / "library.db")
+    clock = project.SimulatedClock(date(2025, 1, 1))
+    library = Library(SQLiteStorage(path), clock=clock)
+    library.retrieve_library()
+    for i in range(2):
+        library._add_book(Book(f"Book {i}", "Author", f"isbn-{i}", "Genre", total_copies=2))
+    a = Member("A", 30, "a@example.com", "Passw0rd!")
+    library._add_member(a)
+    fine = project.FINE_PER_DAY
+    loan = library.borrow_book(a, "isbn-0", reserve=False)
+
+    clock.today = loan.due_date + timedelta(days=5)
+    assert library.outstanding_fine(a) == 5 * fine
+    assert library.overdue_loans() == [loan]
+    assert library.borrow_book(a, "isbn-1", reserve=False) is None  # fines block borrowing
+    library.clear_dues(a)  # paid while the loan is still open
+    assert library.outstanding_fine(a) == 0
+
+    clock.today += timedelta(days=2)
+    assert library.outstanding_fine(a) == 2 * fine
+    library.return_book(a, "isbn-0")  # charges the 7 days net of the 5 prepaid
+    clock.today += timedelta(days=30)
+    assert library.outstanding_fine(a) == 2 * fine  # frozen at the return
+    assert library.overdue_loans() == []
+
+    def reloaded():
+        copy = Library(SQLiteStorage(path), clock=clock)
+        copy.retrieve_library()
+        return copy, copy.get_member_by_email("a@example.com")
+    copy, member = reloaded()
+    assert copy.outstanding_fine(member) == 2 * fine
+    copy.storage.close()
+    library.clear_dues(a)
+    assert library.outstanding_fine(a) == 0
+    library.clear_dues(a)  # nothing left: no second charge
+    assert sum(entry.amount for entry in library._ledger.entries if entry.kind == "payment") == 7 * fine
+    assert library.borrow_book(a, "isbn-1", reserve=False) is not None
+    library.storage.close()
+    copy, member = reloaded()
+    assert copy.outstanding_fine(member) == 0
+    assert len(copy._ledger.entries) == len(library._ledger.entries)
+    copy.storage.close()
+
+
+def test_sqlite_round_trip(tmp_path):
+    path = str(tmp_path / "library.db")
+    library = Library(SQLiteStorage(path))
+    library.retrieve_library()
+    books = [Book(f"Book {i}", "Author", f"isbn-{i}", "Genre", total_copies=1) for i in range(5)]
+    for book in books:
+        library._add_book(book)
+    a, b, c, d = members = [Member(name, 30, f"{name.lower()}@example.com", "Passw0rd!") for name in "ABCD"]
+    for member in members:
+        library._add_member(member)
+    library.borrow_book(a, "isbn-0", reserve=False)  # rewrites the first book's row
+    library.reserve_book(b, books[0], tier=1)
+    library.reserve_book(c, books[0])
+    library.reserve_book(d, books[0])
+    library.borrow_book(a, "isbn-2", reserve=False)
+    library.reserve_book(b, books[2])
+    library.return_book(a, "isbn-2")  # closes a loan and holds the copy for b
+    library._remove_member(d)
+    library._remove_book(books[4])
+    library.storage.close()
+
+    copy = Library(SQLiteStorage(path, lazy_history=True))
+    copy.retrieve_library()
+    try:
+        assert [book.isbn for book in copy.books] == [f"isbn-{i}" for i in range(4)]
+        assert copy.get_book_by_isbn("isbn-4") is None and copy.get_member_by_email("d@example.com") is None
+        first = copy.get_book_by_isbn("isbn-0")
+        assert [(m.email, tier) for m, tier in first.reservation_queue.entries()] == [
+            ("c@example.com", 0), ("b@example.com", 1)]
+        held = copy.get_book_by_isbn("isbn-2")
+        assert {m.email: until for m, until in held.holds.items()} == {"b@example.com": books[2].holds[b]}
+        member = copy.get_member_by_email("a@example.com")
+        assert [book.isbn for book in member.borrowed_books] == ["isbn-0"]
+        # lazy: only the open loan until the member's history is asked for
+        assert [(t.book.isbn, t.return_date) for t in member.transactions] == [("isbn-0", None)]
+        copy.load_history([member])
+        assert [t.book.isbn for t in member.transactions] == ["isbn-0", "isbn-2"]
+        assert member.transactions[1].return_date is not None
+    finally:
+        copy.storage.close()
+
+
+def test_metrics_count_the_items_a_call_scanned():
+    library = Library()
+    for i in range(50):
+        library._add_book(Book(f"Title {i}", "Author", f"isbn-{i}", "Genre"))
+    library._add_book(Book("Dune", "Frank Herbert", "isbn-dune", "Science Fiction"))
+    project.metrics.reset()
+    project.metrics.enable()
+    try:
+        library.search_book("dune")
+        library.search_book("dune")  # served from the cache: nothing scanned
+    finally:
+        project.metrics.disable()
+    op = project.metrics.snapshot()["search_book"]
+    project.metrics.reset()
+    assert op["calls"] == 2 and op["scanned"] == 1
+
+
+def test_compact_member_histories_are_row_ids(tmp_path):
+    library = build_library(20, 5, 200, compact=True)
+    member = library.members[0]
+    assert isinstance(member.transactions, project.TransactionRows)
+    rows = list(member.transactions.rows)
+    assert [t.id for t in member.transactions] == rows
+    assert all(t.member is member for t in member.transactions)
+    fresh = Member("New", 30, "new@example.com", "Passw0rd!")  # no fines to block the loan
+    library._add_member(fresh)
+    loan = library.borrow_book(fresh, library.books[0].isbn, reserve=False)
+    assert list(fresh.transactions) == [loan] and isinstance(fresh.transactions, project.TransactionRows)
+
+    path = str(tmp_path / "library.pkl")
+    PickleStorage(path).save(library)
+    copy = Library(PickleStorage(path), compact=True)
+    copy.retrieve_library()
+    assert list(copy.get_member_by_email(member.email).transactions.rows) == rows
+    history = copy.get_member_by_email("new@example.com").transactions
+    assert list(history.rows) == [loan.id] and history[-1].return_date is None
+
+
+def test_migration_hashes_plaintext_passwords(tmp_path):
+    legacy = Library()
+    for i in range(3):
+        member = Member(f"M{i}", 30, f"m{i}@example.com", "Passw0rd!")
+        member.password = "Passw0rd!"  # as stored by libraries from before hashing
+        legacy.members.append(member)
+    legacy._rebuild_indexes()
+    pickle_path, db_path = str(tmp_path / "library.pkl"), str(tmp_path / "library.db")
+    PickleStorage(pickle_path).save(legacy)
+    project.migrate_library(pickle_path, db_path)
+
+    library = Library(SQLiteStorage(db_path))
+    library.retrieve_library()
+    try:
+        assert all(project.is_password_hash(m.password) for m in library.members)
+        assert library.authenticate("m1@example.com", "Passw0rd!") is library.members[1]
+    finally:
+        library.storage.close()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import pytest
+
+from project import Book, Library, Member, PickleStorage
+from service import LibraryClient, start_server
+
+
+@pytest.fixture
+def library(tmp_path):
+    library = Library(PickleStorage(str(tmp_path / "library.pkl")))
+    library._add_book(Book("Dune", "Frank Herbert", "isbn-1", "Science Fiction", total_copies=1))
+    library._add_book(Book("Emma", "Jane Austen", "isbn-2", "Romance", total_copies=2))
+    library._add_member(Member("Ada", 30, "ada@example.com", "Passw0rd!"))
+    library._add_member(Member("Bob", 40, "bob@example.com", "Passw0rd!"))
+    return library
+
+
+def with_client(library, scenario):
+    """Serve library on a free local port and run scenario(client) against it."""
+    async def main():
+        server = await start_server(library, port=0)
+        client = await LibraryClient.connect(port=server.sockets[0].getsockname()[1])
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+    return asyncio.run(main())
+
+
+def test_borrow_return_and_search(library):
+    async def scenario(client):
+        borrowed = await client.call("borrow", email="ada@example.com", book="Dune")
+        assert borrowed["ok"] and borrowed["result"]
+        assert any("borrowed 'Dune'" in line for line in borrowed["messages"])
+        found = await client.call("search", query="Dune")
+        assert found["result"][0]["available_copies"] == 0
+        refused = await client.call("borrow", email="bob@example.com", book="Dune", reserve=False)
+        assert refused["ok"] and refused["result"] is None
+        returned = await client.call("return", email="ada@example.com", book="Dune")
+        assert returned["ok"]
+        assert (await client.call("search", query="Dune"))["result"][0]["available_copies"] == 1
+    with_client(library, scenario)
+
+
+def test_session_identifies_member(library):
+    async def scenario(client):
+        assert not (await client.call("login", email="ada@example.com", password="wrong"))["ok"]
+        token = (await client.call("login", email="ada@example.com", password="Passw0rd!"))["result"]
+        assert (await client.call("borrow", session=token, book="Emma"))["ok"]
+        dues = await client.call("dues", session=token)
+        assert dues["ok"] and dues["result"]["total"] == 0
+        # a bad session is an error, not a silent generic recommendation
+        assert not (await client.call("recommend", session="nope"))["ok"]
+        assert (await client.call("recommend", session=token))["ok"]
+    with_client(library, scenario)
+
+
+def test_bad_requests_get_error_replies(library):
+    async def scenario(client):
+        bad = [await client.call("search", query="Dune", limit="5"),
+               await client.call("search", query="Dune", limit=-1),
+               await client.call("reserve", email="ada@example.com", book="Dune", tier=True),
+               await client.call("borrow", email=["ada@example.com"], book="Dune"),
+               await client.call("borrow", email="nobody@example.com", book="Dune"),
+               await client.call("no_such_op")]
+        assert [response["ok"] for response in bad] == [False] * len(bad)
+        assert "'limit' must be an integer" in bad[0]["error"]
+        # the connection survives all of the above
+        assert (await client.call("search", query="Emma", limit=1))["ok"]
+    with_client(library, scenario)
+
+
+def test_unexpected_errors_keep_the_connection(library, monkeypatch):
+    def broken(*args, **kwargs):
+        raise TypeError("boom")
+    monkeypatch.setattr(library, "search_book", broken)
+
+    async def scenario(client):
+        response = await client.call("search", query="Dune")
+        assert not response["ok"] and "boom" in response["error"]
+        assert (await client.call("borrow", email="ada@example.com", book="Emma"))["ok"]
+    with_client(library, scenario)
+
+
+def test_malformed_lines(library):
+    async def scenario(client):
+        for line in (b"not json\n", b"[1, 2]\n", b"\xff\xfe\n"):
+            client._writer.write(line)
+            await client._writer.drain()
+            response = await client._reader.readline()
+            assert b'"ok": false' in response
+        assert (await client.call("search", query="Dune"))["ok"]
+    with_client(library, scenario)
+
+
+def test_login_does_not_stall_other_clients(library, monkeypatch):
+    login = library.login
+
+    def slow_login(email, password):
+        time.sleep(0.5)
+        return login(email, password)
+    monkeypatch.setattr(library, "login", slow_login)
+
+    async def scenario(client):
+        other = await LibraryClient.connect(port=client._writer.get_extra_info("peername")[1])
+        try:
+            # client and server share this loop, so time from before the login goes out
+            started = time.perf_counter()
+            pending = asyncio.create_task(client.call("login", email="ada@example.com", password="Passw0rd!"))
+            await asyncio.sleep(0.05)
+            assert (await other.call("search", query="Dune"))["ok"]
+            assert time.perf_counter() - started < 0.3
+            assert (await pending)["ok"]
+        finally:
+            await other.close()
+    with_client(library, scenario)
@@ -0,0 +1,81 @@
+import pytest
+
+from sharding import ShardedLibrary, shard_of
+
+
+def keys_on(shard, template, count=1, n_shards=2):
+    """The first `count` keys made from template that land on shard."""
+    keys = (template.format(i) for i in range(1000))
+    return [key for key in keys if shard_of(key, n_shards) == shard][:count]
+
+
+@pytest.fixture
+def sharded():
+    sharded = ShardedLibrary(2)
+    for shard in range(2):
+        for isbn in keys_on(shard, "isbn-{}", 3):
+            sharded.add_book(f"Book {isbn}", "Author", isbn, "Fantasy", total_copies=1)
+        (email,) = keys_on(shard, "member{}@example.com")
+        assert sharded.add_member(f"Member {shard}", 30, email, "Passw0rd!")
+    yield sharded
+    sharded.close()
+
+
+def available(sharded, isbn):
+    # find_book asks the book's shard first, so this is the copy count held there
+    return sharded.find_book(isbn)["available_copies"]
+
+
+def test_same_shard_borrow(sharded):
+    (email,), (isbn,) = keys_on(0, "member{}@example.com"), keys_on(0, "isbn-{}")
+    assert sharded.borrow_book(email, isbn)
+    assert available(sharded, isbn) == 0
+    assert sharded.borrow_book(keys_on(1, "member{}@example.com")[0], isbn) is None
+    assert sharded.return_book(email, isbn) == 0
+    assert available(sharded, isbn) == 1
+
+
+def test_cross_shard_borrow_and_return(sharded):
+    (email,), (isbn,) = keys_on(0, "member{}@example.com"), keys_on(1, "isbn-{}")
+    assert sharded.borrow_book(email, isbn)
+    assert available(sharded, isbn) == 0
+    assert sharded.counts()[0]["transactions"] == 1  # the loan lives on the member's shard
+    assert sharded.return_book(email, isbn) == 0
+    assert available(sharded, isbn) == 1
+    assert sharded.return_book(email, isbn) is None  # nothing left to return, and no copy is put back
+    assert available(sharded, isbn) == 1
+
+
+def test_failed_open_loan_puts_the_copy_back(sharded, monkeypatch):
+    (email,), (isbn,) = keys_on(0, "member{}@example.com"), keys_on(1, "isbn-{}")
+    call = sharded._call
+
+    def failing_open_loan(shard, op, *args):
+        if op == "open_loan":
+            args = ("nobody@example.com",) + args[1:]
+        return call(shard, op, *args)
+    monkeypatch.setattr(sharded, "_call", failing_open_loan)
+    assert sharded.borrow_book(email, isbn) is None
+    assert available(sharded, isbn) == 1
+
+
+def test_scatter_search(sharded):
+    isbns = keys_on(0, "isbn-{}", 3) + keys_on(1, "isbn-{}", 3)
+    found = sharded.search_book("Book")
+    assert sorted(record["isbn"] for record in found) == sorted(isbns)
+    assert [record["isbn"] for record in sharded.search_book(isbns[4])] == [isbns[4]]
+    # close matches only, best first over both shards
+    typo = f"Bok {isbns[0]}"
+    assert sharded.search_book(typo)[0]["isbn"] == isbns[0]
+    assert sharded.search_book("nothing like it at all") is None
+
+
+def test_genre_recommendations_cover_every_shard(sharded):
+    (email,) = keys_on(0, "member{}@example.com")
+    (other,) = keys_on(1, "member{}@example.com")
+    own, remote = keys_on(0, "isbn-{}", 3), keys_on(1, "isbn-{}", 3)
+    assert sharded.borrow_book(other, remote[0])
+    assert sharded.borrow_book(email, own[0])
+    picks = sharded.recommend_books(email, mode="personalized", n=2)
+    assert picks[0] == f"Book {remote[0]}"  # the only other book borrowed so far
+    assert len(picks) == 2